@@ -0,0 +1,90 @@
+"""Frame-by-frame writer for animated PNG files.
+
+Pillow's APNG encoder collects every frame in memory before it writes the first one. ``APNGWriter``
+instead encodes each frame as a PNG of its own as soon as it is added, moves its image data into the
+``IDAT`` (first frame) or ``fdAT`` chunks of the animation and drops it, so only one frame is held at
+a time. Frames are written as complete canvases that replace the previous one, which is how Pillow
+hands out the frames of an animation it reads.
+"""
+
+import io
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+_ACTL = struct.Struct(">II")  # frame count, play count (0: loop forever)
+_FCTL = struct.Struct(">IIIIIHHBB")  # sequence, width, height, x, y, delay numerator, delay denominator, dispose, blend
+_SEQUENCE = struct.Struct(">I")
+
+_DISPOSE_NONE = 0
+_BLEND_SOURCE = 0
+
+
+def _chunk(chunk_type, data):
+    """Return the PNG chunk ``chunk_type`` holding ``data``."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)))
+
+
+def _iter_chunks(png):
+    """Yield ``(chunk_type, data)`` for the chunks of the encoded PNG ``png``."""
+    offset = len(PNG_SIGNATURE)
+    while offset < len(png):
+        length, chunk_type = struct.unpack_from(">I4s", png, offset)
+        yield chunk_type, png[offset + 8:offset + 8 + length]
+        offset += 12 + length
+
+
+class APNGWriter:
+    """Write ``frame_count`` frames to the binary file object ``file`` as they are added."""
+
+    def __init__(self, file, frame_count, loop=0):
+        if frame_count < 1:
+            raise ValueError("An animation needs at least one frame")
+        self.file = file
+        self.frame_count = frame_count
+        self.loop = loop
+        self.frames = 0
+        self._sequence = 0
+        self._header = None
+
+    def add(self, image, duration=0):
+        """Encode the PIL ``image`` and append it as the next frame, shown for ``duration`` milliseconds.
+
+        Every frame must have the size and mode of the first one. Raises ``ValueError`` otherwise or if
+        more than ``frame_count`` frames are added.
+        """
+        if self.frames == self.frame_count:
+            raise ValueError(f"The animation already has its {self.frame_count} frames")
+        encoded = io.BytesIO()
+        image.save(encoded, "PNG")
+        chunks = list(_iter_chunks(encoded.getbuffer()))
+        header = bytes(chunks[0][1])
+        data = b"".join(chunk_data for chunk_type, chunk_data in chunks if chunk_type == b"IDAT")
+        if self._header is None:
+            self._header = header
+            self.file.write(PNG_SIGNATURE + _chunk(b"IHDR", header))
+            for chunk_type, chunk_data in chunks[1:]:
+                # Palette and transparency chunks have to come before any image data.
+                if chunk_type in (b"PLTE", b"tRNS"):
+                    self.file.write(_chunk(chunk_type, bytes(chunk_data)))
+            self.file.write(_chunk(b"acTL", _ACTL.pack(self.frame_count, self.loop)))
+        elif header != self._header:
+            raise ValueError("Every frame must have the size and mode of the first frame")
+
+        width, height = image.size
+        self.file.write(_chunk(b"fcTL", _FCTL.pack(self._sequence, width, height, 0, 0, int(duration), 1000,
+                                                   _DISPOSE_NONE, _BLEND_SOURCE)))
+        self._sequence += 1
+        if self.frames == 0:
+            self.file.write(_chunk(b"IDAT", data))
+        else:
+            self.file.write(_chunk(b"fdAT", _SEQUENCE.pack(self._sequence) + data))
+            self._sequence += 1
+        self.frames += 1
+
+    def close(self):
+        """Finish the file; raises ``ValueError`` if fewer than ``frame_count`` frames were added."""
+        if self.frames != self.frame_count:
+            raise ValueError(f"Only {self.frames} of {self.frame_count} frames were added")
+        self.file.write(_chunk(b"IEND", b""))
@@ -0,0 +1,142 @@
+"""Run many hide/decode jobs in parallel worker processes.
+
+Jobs are plain dicts so they can come from a manifest file or be built from directories. Each job runs
+in a worker of a process pool, so interpreter, NumPy and Pillow start-up is paid once per worker
+rather than once per file, and a failing job is reported without stopping the rest of the batch.
+"""
+
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import image_encryptor
+import instrumentation
+
+
+def load_manifest(manifest_path, defaults=None):
+    """Return the jobs listed in ``manifest_path``.
+
+    ``.jsonl``/``.json`` manifests hold one JSON object per line, anything else is read as CSV with a
+    header row. Missing fields are taken from ``defaults``.
+    """
+    defaults = defaults or {}
+    with open(manifest_path, newline="", encoding="utf-8") as manifest:
+        if manifest_path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in manifest if line.strip()]
+        else:
+            rows = list(csv.DictReader(manifest))
+    return [{**defaults, **{name: value for name, value in row.items() if value not in (None, "")}} for row in rows]
+
+
+def hide_jobs_from_directories(images_dir, files_dir, output_dir, defaults=None):
+    """Pair the sorted files of ``images_dir`` and ``files_dir`` into hide jobs writing to ``output_dir``.
+
+    Raises ``ValueError`` if the two directories hold a different number of files.
+    """
+    images = _list_files(images_dir)
+    files = _list_files(files_dir)
+    if len(images) != len(files):
+        raise ValueError(f"{images_dir} has {len(images)} files but {files_dir} has {len(files)}")
+    return [
+        {**(defaults or {}), "image": image, "file": file,
+         "output": os.path.join(output_dir, os.path.basename(file) + ".png")}
+        for image, file in zip(images, files)
+    ]
+
+
+def decode_jobs_from_directory(images_dir, output_dir):
+    """Return a decode job for every file in ``images_dir``, writing ``<name>.bin`` to ``output_dir``."""
+    return [
+        {"image": image, "output": os.path.join(output_dir, os.path.splitext(os.path.basename(image))[0] + ".bin")}
+        for image in _list_files(images_dir)
+    ]
+
+
+def _list_files(directory):
+    return sorted(entry.path for entry in os.scandir(directory) if entry.is_file())
+
+
+def _hide(job):
+    level = job.get("compression_level")
+    ok = image_encryptor.hide_file_in_png(job["image"], job["file"], job.get("key", ""), job["output"],
+                                          int(job.get("bits_per_channel", 1)),
+                                          compression=job.get("compression") or None,
+                                          compression_level=None if level is None else int(level))
+    return ok, os.path.getsize(job["file"]) if ok else 0
+
+
+def _decode(job):
+    ok = bool(image_encryptor.decode_file_from_png(job["image"], job["output"]))
+    return ok, os.path.getsize(job["output"]) if ok else 0
+
+
+_ACTIONS = {"hide": _hide, "decode": _decode}
+
+
+def run_job(action, job):
+    """Run a single ``hide`` or ``decode`` job and return its result record; never raises."""
+    started = time.perf_counter()
+    cache_before = image_encryptor.cover_cache_stats()
+    messages = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(messages):
+            ok, size = _ACTIONS[action](job)
+        error = None if ok else messages.getvalue().strip() or "failed"
+    except Exception as e:
+        ok, size, error = False, 0, f"{type(e).__name__}: {e}"
+    result = {
+        "job": job,
+        "status": "ok" if ok else "error",
+        "bytes": size,
+        "seconds": round(time.perf_counter() - started, 6),
+        "error": error,
+    }
+    if cache_before is not None:
+        cache_after = image_encryptor.cover_cache_stats()
+        result["cover_cache"] = {counter: cache_after[counter] - cache_before[counter] for counter in ("hits", "misses")}
+    return result
+
+
+def run_batch(action, jobs, workers=None, on_result=None, cover_cache_bytes=0):
+    """Run ``jobs`` for ``action`` (``"hide"`` or ``"decode"``) on a pool of ``workers`` processes.
+
+    ``on_result`` is called with each result record as soon as its job finishes. With
+    ``cover_cache_bytes`` every worker keeps up to that many bytes of decoded covers, so jobs reusing a
+    cover skip decoding it. Returns a summary dict with the per-job results in completion order and the
+    aggregate counts, throughput and cover cache hits and misses.
+    """
+    if action not in _ACTIONS:
+        raise ValueError(f"Unknown batch action {action!r}")
+    started = time.perf_counter()
+    results = []
+    initializer = image_encryptor.enable_cover_cache if cover_cache_bytes else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=(cover_cache_bytes,)) as pool:
+        futures = [instrumentation.submit(pool, run_job, action, job) for job in jobs]
+        for future in as_completed(futures):
+            result = instrumentation.result(future)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    wall = time.perf_counter() - started
+    total_bytes = sum(result["bytes"] for result in results)
+    succeeded = sum(result["status"] == "ok" for result in results)
+    summary = {
+        "action": action,
+        "jobs": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "bytes": total_bytes,
+        "wall_seconds": round(wall, 6),
+        "throughput_mb_s": round(total_bytes / wall / 1e6, 3) if wall else 0.0,
+        "results": results,
+    }
+    if cover_cache_bytes:
+        summary["cover_cache"] = {
+            counter: sum(result.get("cover_cache", {}).get(counter, 0) for result in results)
+            for counter in ("hits", "misses")
+        }
+    return summary
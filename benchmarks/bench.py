@@ -0,0 +1,199 @@
+"""Benchmarks for the image and text codecs.
+
+Synthetic cover images and payloads are generated in memory, and PNG load, hide, save and decode are
+timed separately so a regression can be pinned to one stage. Every result reports the best time over
+``--repeat`` runs, the throughput and the peak Python/NumPy allocation seen by ``tracemalloc`` in one
+extra traced run (Pillow's own pixel buffers are not traced).
+
+    python benchmarks/bench.py                                  # print the results
+    python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench.py --compare benchmarks/baseline.json --threshold 0.25
+
+``--compare`` exits with status 1 if any benchmark is slower than the baseline by more than the
+threshold (a fraction: 0.25 allows 25% slowdown); benchmarks under ``--min-seconds`` are ignored.
+"""
+
+import argparse
+import io
+import json
+import math
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from PIL import Image
+
+import image_encryptor
+import text_encryptor
+
+SIZES = {"small": (256, 256), "medium": (1024, 1024), "large": (2048, 2048)}
+MODES = ("RGB", "RGBA", "L")
+PAYLOADS = {"1KB": 1 << 10, "64KB": 1 << 16, "capacity": None}
+TEXT_SIZES = {"1MB": 1 << 20, "8MB": 1 << 23}
+TEXT_KEY = "Benchmark"
+
+
+def _measure(function, setup=lambda: (), repeat=3):
+    """Return ``(best_seconds, peak_bytes)`` for ``function(*setup())``; setup runs outside the timing."""
+    best = math.inf
+    for _ in range(repeat):
+        args = setup()
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    args = setup()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def _record(seconds, peak, data_bytes=0, pixels=0):
+    result = {"seconds": round(seconds, 6), "peak_mb": round(peak / 1e6, 3)}
+    if data_bytes:
+        result["mb_s"] = round(data_bytes / seconds / 1e6, 3)
+    if pixels:
+        result["mpixel_s"] = round(pixels / seconds / 1e6, 3)
+    return result
+
+
+def _cover_png(size, mode, rng):
+    """Return PNG bytes of a random cover image of ``size`` in ``mode``."""
+    width, height = size
+    shape = (height, width) if mode == "L" else (height, width, len(mode))
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8), mode).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _load(png):
+    image = Image.open(io.BytesIO(png))
+    image.load()
+    return image
+
+
+def _decode(image):
+    header = image_encryptor._image_header(image)
+    return b"".join(image_encryptor._iter_payload(image, header, image_encryptor.TILE_BUDGET))
+
+
+def bench_images(sizes, modes, payloads, repeat, rng):
+    """Return the results of the image benchmarks keyed by ``stage/size/mode[/payload]``."""
+    results = {}
+    for size_name in sizes:
+        size = SIZES[size_name]
+        pixels = size[0] * size[1]
+        for mode in modes:
+            png = _cover_png(size, mode, rng)
+            results[f"load/{size_name}/{mode}"] = _record(*_measure(_load, lambda: (png,), repeat), pixels=pixels)
+            cover = _load(png)
+            capacity = image_encryptor._capacity_bytes(pixels * len(mode))
+            for payload_name in payloads:
+                length = min(PAYLOADS[payload_name] or capacity, capacity)
+                payload = rng.integers(0, 256, length, dtype=np.uint8).tobytes()
+                key = f"{size_name}/{mode}/{payload_name}"
+
+                hide = _measure(image_encryptor._embed_image, lambda: (cover.copy(), payload), repeat)
+                results[f"hide/{key}"] = _record(*hide, length, pixels)
+
+                encoded = image_encryptor._embed_image(cover.copy(), payload)
+                save = _measure(lambda image: image.save(io.BytesIO(), "PNG"), lambda: (encoded,), repeat)
+                results[f"save/{key}"] = _record(*save, pixels=pixels)
+
+                assert _decode(encoded) == payload
+                results[f"decode/{key}"] = _record(*_measure(_decode, lambda: (encoded,), repeat), length, pixels)
+    return results
+
+
+def bench_text(text_sizes, repeat, rng):
+    """Return the results of the text benchmarks keyed by ``operation/size``."""
+    results = {}
+    alphabet = np.frombuffer(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ      .,;!\n0123456789", np.uint8)
+    for size_name in text_sizes:
+        length = TEXT_SIZES[size_name]
+        plaintext = alphabet[rng.integers(0, alphabet.size, length)].tobytes().decode("ascii")
+        ciphertext = text_encryptor.encrypt_text(plaintext, TEXT_KEY)
+        encrypt = _measure(text_encryptor.encrypt_text, lambda: (plaintext, TEXT_KEY), repeat)
+        results[f"encrypt/{size_name}"] = _record(*encrypt, length)
+        decrypt = _measure(text_encryptor.decrypt_text, lambda: (ciphertext, TEXT_KEY), repeat)
+        results[f"decrypt/{size_name}"] = _record(*decrypt, length)
+    return results
+
+
+def compare(baseline, current, threshold, min_seconds=1e-3):
+    """Return ``(name, baseline_seconds, current_seconds)`` for every benchmark slower than allowed.
+
+    Benchmarks faster than ``min_seconds`` are too noisy to judge and are skipped.
+    """
+    regressions = []
+    for name, result in current.items():
+        reference = baseline.get(name)
+        if not reference or result["seconds"] < min_seconds:
+            continue
+        if result["seconds"] > reference["seconds"] * (1 + threshold):
+            regressions.append((name, reference["seconds"], result["seconds"]))
+    return regressions
+
+
+def _print_results(results, baseline=None):
+    print(f"{'benchmark':<34}{'seconds':>11}{'MB/s':>10}{'Mpix/s':>10}{'peak MB':>10}{'vs base':>9}")
+    for name, result in results.items():
+        change = ""
+        if baseline and name in baseline:
+            change = f"{result['seconds'] / baseline[name]['seconds']:.2f}x"
+        print(f"{name:<34}{result['seconds']:>11.6f}{result.get('mb_s', ''):>10}"
+              f"{result.get('mpixel_s', ''):>10}{result['peak_mb']:>10}{change:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image and text codecs")
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma-separated cover sizes from {list(SIZES)}")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated image modes")
+    parser.add_argument("--payloads", default=",".join(PAYLOADS), help=f"Comma-separated payloads from {list(PAYLOADS)}")
+    parser.add_argument("--text-sizes", default=",".join(TEXT_SIZES), help=f"Comma-separated text sizes from {list(TEXT_SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the best is kept")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results to PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against the baseline stored in PATH")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown for --compare (default: 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=1e-3,
+                        help="Ignore benchmarks faster than this in --compare (default: 0.001)")
+    args = parser.parse_args(argv)
+
+    split = lambda value: [item for item in value.split(",") if item]
+    rng = np.random.default_rng(0)
+    results = bench_images(split(args.sizes), split(args.modes), split(args.payloads), args.repeat, rng)
+    results.update(bench_text(split(args.text_sizes), args.repeat, rng))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "numpy": np.__version__, "results": results}, file, indent=2)
+            file.write("\n")
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold, args.min_seconds)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.4f}s -> {after:.4f}s ({after / before:.2f}x)", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
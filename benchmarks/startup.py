@@ -0,0 +1,135 @@
+"""Start-up benchmark for the command line entry points.
+
+Every subcommand is run in a fresh interpreter (``--no-daemon``, on tiny inputs) so the result is
+dominated by interpreter start-up and imports. For each command the best wall time over ``--repeat``
+runs is reported together with the total import time measured by ``python -X importtime`` and whether
+NumPy was loaded, so a change that makes a text command import the image codec shows up at once.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --save-baseline benchmarks/startup_baseline.json
+    python benchmarks/startup.py --compare benchmarks/startup_baseline.json --threshold 0.5
+"""
+
+import argparse
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench import compare
+
+ROOT = Path(__file__).resolve().parents[1]
+
+COMMANDS = {
+    "help": ["--help"],
+    "encrypt-text": ["encrypt-text", "Hello World", "Key"],
+    "decrypt-text": ["decrypt-text", "Rijvs Gspvh", "Key"],
+    "encrypt-file": ["encrypt-file", "{plain}", "Key", "{work}/cipher.txt"],
+    "decrypt-file": ["decrypt-file", "{work}/cipher.txt", "Key", "{work}/plain.out"],
+    "hide-message": ["hide-message", "{cover}", "Hello", "Key", "{work}/message.png"],
+    "decode-message": ["decode-message", "{work}/message.png", "Key"],
+    "capacity": ["capacity", "{cover}"],
+}
+
+
+def _prepare(work):
+    """Write the tiny inputs the commands run on and return the placeholders for their arguments."""
+    from PIL import Image
+
+    cover = work / "cover.png"
+    Image.new("RGB", (32, 32), (120, 80, 40)).save(cover)
+    plain = work / "plain.txt"
+    plain.write_text("Hello World\n")
+    return {"work": str(work), "cover": str(cover), "plain": str(plain)}
+
+
+def _import_seconds(stderr):
+    """Return the summed cumulative time of the top-level imports in ``-X importtime`` output."""
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e6
+
+
+def run_command(arguments):
+    """Run ``cli.py arguments`` in a fresh interpreter and return ``(seconds, import_seconds, numpy_loaded)``."""
+    command = [sys.executable, "-X", "importtime", str(ROOT / "cli.py"), *arguments]
+    if arguments[0] != "--help":
+        command.append("--no-daemon")
+    started = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} failed: {completed.stderr.strip().splitlines()[-1:]}")
+    numpy_loaded = any(line.startswith("import time:") and line.split("|")[-1].strip() == "numpy"
+                       for line in completed.stderr.splitlines())
+    return seconds, _import_seconds(completed.stderr), numpy_loaded
+
+
+def bench_startup(commands, repeat):
+    """Return the start-up results keyed by ``startup/<command>``."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        placeholders = _prepare(Path(directory))
+        for name in commands:
+            arguments = [argument.format(**placeholders) for argument in COMMANDS[name]]
+            best, best_imports, numpy_loaded = math.inf, math.inf, False
+            for _ in range(repeat):
+                seconds, import_seconds, numpy_loaded = run_command(arguments)
+                best = min(best, seconds)
+                best_imports = min(best_imports, import_seconds)
+            results[f"startup/{name}"] = {
+                "seconds": round(best, 6),
+                "import_seconds": round(best_imports, 6),
+                "numpy": numpy_loaded,
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the start-up cost of every subcommand")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help=f"Comma-separated commands from {list(COMMANDS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command; the best is kept")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results to PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against the baseline stored in PATH")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed slowdown for --compare (default: 0.5)")
+    args = parser.parse_args(argv)
+
+    results = bench_startup([name for name in args.commands.split(",") if name], args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'command':<26}{'seconds':>11}{'imports':>11}{'numpy':>7}")
+        for name, result in results.items():
+            print(f"{name:<26}{result['seconds']:>11.4f}{result['import_seconds']:>11.4f}{'yes' if result['numpy'] else '':>7}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version.split()[0], "results": results}, file, indent=2)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.4f}s -> {after:.4f}s ({after / before:.2f}x)", file=sys.stderr)
+        newly_loaded = [name for name, result in results.items()
+                        if result["numpy"] and name in baseline and not baseline[name]["numpy"]]
+        for name in newly_loaded:
+            print(f"REGRESSION {name}: now imports NumPy", file=sys.stderr)
+        return 1 if regressions or newly_loaded else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
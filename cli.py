@@ -1,75 +1,349 @@
 import argparse
-import image_encryptor
-import text_encryptor
+import json
+import os
+import sys
+import time
 
+import daemon
+import instrumentation
+import payload_compression
+from operations import load
 
-def main() -> None:
+DEFAULT_TILE_BUDGET_MIB = 64
+
+
+def run_batch_command(args) -> None:
+    """Build the jobs for a batch subcommand, run them and print the JSON summary.
+
+    Each finished job is reported on stderr as a JSON line while the batch runs.
+    """
+    action = "hide" if args.command == "batch-hide" else "decode"
+    defaults = {}
+    if action == "hide":
+        defaults = {"key": args.key, "bits_per_channel": args.bits_per_channel, "compression": args.compress,
+                    "compression_level": args.compress_level}
+    try:
+        if args.manifest:
+            jobs = load("load-manifest")(args.manifest, defaults)
+        elif action == "hide":
+            jobs = load("hide-jobs")(args.images, args.files, args.output_dir, defaults)
+        else:
+            jobs = load("decode-jobs")(args.images, args.output_dir)
+    except (OSError, ValueError) as e:
+        print(str(e))
+        return
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def report(result):
+        print(json.dumps(result), file=sys.stderr, flush=True)
+
+    cover_cache_bytes = args.cover_cache << 20 if action == "hide" else 0
+    summary = load("batch")(action, jobs, args.workers, on_result=report, cover_cache_bytes=cover_cache_bytes)
+    print(json.dumps(summary, indent=2))
+
+
+def run_tree_command(args) -> None:
+    """Encrypt or decrypt a directory tree and print the JSON summary.
+
+    Each file that is read is reported on stderr as a JSON line while the tree is processed.
+    """
+
+    def report(result):
+        print(json.dumps(result), file=sys.stderr, flush=True)
+
+    try:
+        summary = load(args.command)(args.input_dir, args.key, args.output_dir, args.workers, args.manifest,
+                                     on_result=report)
+    except (OSError, ValueError) as e:
+        print(str(e))
+        return
+    print(json.dumps(summary, indent=2))
+
+
+def run_command(args) -> int:
+    """Run the subcommand selected by ``args`` and return its exit status.
+
+    The implementing module is imported through the operation registry only now, so commands that do
+    not touch images never import NumPy and Pillow.
+    """
+    if args.command == "hide-message":
+        if load("hide-message")(args.image, args.message, args.key, args.output, args.bits_per_channel,
+                                args.tile_budget << 20, args.compress, args.compress_level, args.scatter,
+                                args.convert_palette, args.checksum):
+            print("Message hidden successfully")
+    elif args.command == "decode-message":
+        message = load("decode-message")(args.image, args.key, args.tile_budget << 20)
+        print(message)
+    elif args.command == "hide-file":
+        if load("hide-file")(args.image, args.file, args.key, args.output, args.bits_per_channel,
+                             args.tile_budget << 20, args.compress, args.compress_level, args.scatter,
+                             args.convert_palette, args.checksum):
+            print("File hidden successfully")
+    elif args.command == "decode-file":
+        result = load("decode-file")(args.image, args.output, args.tile_budget << 20, args.key)
+        if result:
+            print(result)
+    elif args.command == "hide-file-sharded":
+        os.makedirs(args.output_dir, exist_ok=True)
+        shards = load("hide-file-sharded")(args.images, args.file, args.output_dir,
+                                           args.bits_per_channel, args.workers)
+        if shards:
+            print(f"File hidden in {len(shards)} image(s):")
+            for shard in shards:
+                print(shard)
+    elif args.command == "hide-file-frames":
+        written = load("hide-file-frames")(args.images, args.file, args.output, args.bits_per_channel)
+        if written:
+            print(f"File hidden in {len(written)} image(s):")
+            for image in written:
+                print(image)
+    elif args.command == "decode-file-frames":
+        result = load("decode-file-frames")(args.images, args.output)
+        if result:
+            print(result)
+    elif args.command == "decode-file-sharded":
+        result = load("decode-file-sharded")(args.images, args.output, args.workers)
+        if result:
+            print(result)
+    elif args.command == "capacity":
+        capacities = load("capacity")(args.image)
+        if capacities:
+            for bits, size in capacities.items():
+                print(f"{bits} bit(s) per channel: {size} bytes")
+    elif args.command == "verify":
+        intact = load("verify")(args.image, args.key, args.tile_budget << 20)
+        if intact is False:
+            print("Payload does not match its checksum")
+        if not intact:
+            return 1
+        print("Payload intact")
+    elif args.command == "inspect":
+        report = load("inspect")(args.image)
+        if report is not None:
+            print(json.dumps(report, indent=2))
+    elif args.command in ("batch-hide", "batch-decode"):
+        run_batch_command(args)
+    elif args.command == "encrypt-text":
+        print(load("encrypt-text")(args.text, args.key))
+    elif args.command == "decrypt-text":
+        print(load("decrypt-text")(args.text, args.key))
+    elif args.command == "encrypt-file":
+        if load("encrypt-file")(args.input, args.key, args.output):
+            print(f"File encrypted and saved as {args.output}")
+    elif args.command == "decrypt-file":
+        if load("decrypt-file")(args.input, args.key, args.output):
+            print(f"File decrypted and saved as {args.output}")
+    elif args.command in ("encrypt-tree", "decrypt-tree"):
+        run_tree_command(args)
+    elif args.command == "serve":
+        address = ("127.0.0.1", args.port) if args.port is not None else args.socket
+        try:
+            load("serve")(address, args.workers)
+        except (OSError, RuntimeError) as e:
+            print(str(e))
+    return 0
+
+
+def print_stats(args, wall_seconds: float) -> None:
+    """Print the per-stage breakdown collected while the command ran to stderr."""
+    stages = instrumentation.summary()
+    if args.stats_json:
+        report = {"command": args.command, "wall_seconds": wall_seconds, "stages": stages}
+        print(json.dumps(report, indent=2), file=sys.stderr)
+    if args.stats:
+        print(instrumentation.format_summary(stages), file=sys.stderr)
+        print(f"total wall time: {wall_seconds:.4f}s", file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the argument parser for every subcommand."""
     parser = argparse.ArgumentParser(description="Simple Encryptor command line")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
-    hide_msg = subparsers.add_parser("hide-message", help="Hide a text message in an image")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--stats", action="store_true", help="Print a per-stage timing breakdown to stderr")
+    common.add_argument("--stats-json", action="store_true", help="Print the per-stage breakdown to stderr as JSON")
+    common.add_argument("--no-daemon", action="store_true", help="Run in this process even if a daemon is running")
+
+    hide_msg = subparsers.add_parser("hide-message", parents=[common], help="Hide a text message in an image")
     hide_msg.add_argument("image", help="Input image file")
     hide_msg.add_argument("message", help="Message to hide")
     hide_msg.add_argument("key", help="Encryption key")
     hide_msg.add_argument("output", help="Output encoded image")
+    hide_msg.add_argument("--bits-per-channel", type=int, choices=range(1, 9), metavar="1-8", default=1,
+                          help="Low bits of each channel value used for the payload; up to 4, or 8 for 16-bit images (default: 1)")
 
-    decode_msg = subparsers.add_parser("decode-message", help="Decode a message from an image")
+    decode_msg = subparsers.add_parser("decode-message", parents=[common], help="Decode a message from an image")
     decode_msg.add_argument("image", help="Encoded image file")
     decode_msg.add_argument("key", help="Decryption key")
 
-    hide_file = subparsers.add_parser("hide-file", help="Hide a file in an image")
+    hide_file = subparsers.add_parser("hide-file", parents=[common], help="Hide a file in an image")
     hide_file.add_argument("image", help="Input image file")
     hide_file.add_argument("file", help="File to hide")
     hide_file.add_argument("key", help="Encryption key")
     hide_file.add_argument("output", help="Output encoded image")
+    hide_file.add_argument("--bits-per-channel", type=int, choices=range(1, 9), metavar="1-8", default=1,
+                           help="Low bits of each channel value used for the payload; up to 4, or 8 for 16-bit images (default: 1)")
 
-    decode_file = subparsers.add_parser("decode-file", help="Extract a file from an image")
+    decode_file = subparsers.add_parser("decode-file", parents=[common], help="Extract a file from an image")
     decode_file.add_argument("image", help="Encoded image")
     decode_file.add_argument("output", help="Output file path")
+    decode_file.add_argument("--key", help="Key of a file hidden with --scatter")
+
+    for hide_command in (hide_msg, hide_file):
+        hide_command.add_argument("--scatter", action="store_true",
+                                  help="Spread the payload over pixels chosen by the key instead of filling rows from the top")
+        hide_command.add_argument("--convert-palette", action="store_true",
+                                  help="Expand palette (P) images to RGB(A) instead of rejecting them")
+        hide_command.add_argument("--checksum", action="store_true",
+                                  help="Record a CRC32 of the payload so the verify command can check it")
+
+    verify = subparsers.add_parser("verify", parents=[common],
+                                   help="Check a payload against its checksum without extracting it")
+    verify.add_argument("image", help="Encoded image file")
+    verify.add_argument("--key", help="Key of a payload hidden with --scatter")
+
+    for image_command in (hide_msg, decode_msg, hide_file, decode_file, verify):
+        image_command.add_argument("--tile-budget", type=int, default=DEFAULT_TILE_BUDGET_MIB,
+                                   metavar="MIB", help="Working memory for image bands in MiB (default: %(default)s)")
+
+    hide_sharded = subparsers.add_parser("hide-file-sharded", parents=[common], help="Split a file across several images")
+    hide_sharded.add_argument("file", help="File to hide")
+    hide_sharded.add_argument("output_dir", help="Directory for the shard images")
+    hide_sharded.add_argument("images", nargs="+", help="Cover images, in the order they are filled")
+    hide_sharded.add_argument("--bits-per-channel", type=int, choices=range(1, 9), metavar="1-8", default=1,
+                              help="Low bits of each channel value used for the payload; up to 4, or 8 for 16-bit images (default: 1)")
+    hide_sharded.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+
+    decode_sharded = subparsers.add_parser("decode-file-sharded", parents=[common], help="Reassemble a file from shard images")
+    decode_sharded.add_argument("output", help="Output file path")
+    decode_sharded.add_argument("images", nargs="+", help="Shard images, in any order")
+    decode_sharded.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+
+    hide_frames = subparsers.add_parser("hide-file-frames", parents=[common],
+                                        help="Spread a file over the frames of an animated PNG or an image sequence")
+    hide_frames.add_argument("file", help="File to hide")
+    hide_frames.add_argument("output", help="Output animated PNG, or the directory for the frames of a sequence")
+    hide_frames.add_argument("images", nargs="+", help="An animated PNG, or the images of a sequence in order")
+    hide_frames.add_argument("--bits-per-channel", type=int, choices=range(1, 9), metavar="1-8", default=1,
+                             help="Low bits of each channel value used for the payload; up to 4, or 8 for 16-bit images (default: 1)")
+
+    decode_frames = subparsers.add_parser("decode-file-frames", parents=[common],
+                                          help="Extract a file spread over the frames of an animated PNG or an image sequence")
+    decode_frames.add_argument("output", help="Output file path")
+    decode_frames.add_argument("images", nargs="+", help="The animated PNG, or the images of the sequence in order")
 
-    enc_text = subparsers.add_parser("encrypt-text", help="Encrypt a text string")
+    capacity = subparsers.add_parser("capacity", parents=[common], help="Show how many bytes an image can hold")
+    capacity.add_argument("image", help="Cover image file")
+
+    inspect = subparsers.add_parser("inspect", parents=[common],
+                                    help="Show the image format, capacity and payload header without decoding the payload")
+    inspect.add_argument("image", help="Image file")
+
+    batch_hide = subparsers.add_parser("batch-hide", parents=[common], help="Hide many files in images in parallel")
+    hide_source = batch_hide.add_mutually_exclusive_group(required=True)
+    hide_source.add_argument("--manifest", help="CSV or JSONL file with image, file, key, output columns")
+    hide_source.add_argument("--images", help="Directory of cover images (paired in sorted order with --files)")
+    batch_hide.add_argument("--files", help="Directory of files to hide")
+    batch_hide.add_argument("--output-dir", help="Directory for encoded images (directory mode)")
+    batch_hide.add_argument("--key", default="", help="Key for jobs that do not specify one")
+    batch_hide.add_argument("--bits-per-channel", type=int, choices=range(1, 9), metavar="1-8", default=1,
+                            help="Mode for jobs that do not specify one (default: 1)")
+    batch_hide.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    batch_hide.add_argument("--cover-cache", type=int, default=0, metavar="MIB",
+                            help="Keep up to MIB of decoded covers per worker for jobs sharing covers (default: off)")
+
+    for hide_command in (hide_msg, hide_file, batch_hide):
+        hide_command.add_argument("--compress", choices=[*payload_compression.CODECS, payload_compression.AUTO],
+                                  help="Compress the payload before hiding it; auto skips it when it does not help")
+        hide_command.add_argument("--compress-level", type=int, choices=range(0, 10), metavar="0-9",
+                                  help="Compression level (default: the codec's default)")
+
+    batch_decode = subparsers.add_parser("batch-decode", parents=[common], help="Extract files from many images in parallel")
+    decode_source = batch_decode.add_mutually_exclusive_group(required=True)
+    decode_source.add_argument("--manifest", help="CSV or JSONL file with image, output columns")
+    decode_source.add_argument("--images", help="Directory of encoded images")
+    batch_decode.add_argument("--output-dir", help="Directory for extracted files (directory mode)")
+    batch_decode.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+
+    enc_text = subparsers.add_parser("encrypt-text", parents=[common], help="Encrypt a text string")
     enc_text.add_argument("text", help="Plain text")
     enc_text.add_argument("key", help="Encryption key")
 
-    dec_text = subparsers.add_parser("decrypt-text", help="Decrypt a text string")
+    dec_text = subparsers.add_parser("decrypt-text", parents=[common], help="Decrypt a text string")
     dec_text.add_argument("text", help="Cipher text")
     dec_text.add_argument("key", help="Decryption key")
 
-    enc_file = subparsers.add_parser("encrypt-file", help="Encrypt a text file")
+    enc_file = subparsers.add_parser("encrypt-file", parents=[common], help="Encrypt a text file")
     enc_file.add_argument("input", help="Input file path")
     enc_file.add_argument("key", help="Encryption key")
     enc_file.add_argument("output", help="Output encrypted file")
 
-    dec_file = subparsers.add_parser("decrypt-file", help="Decrypt a text file")
+    dec_file = subparsers.add_parser("decrypt-file", parents=[common], help="Decrypt a text file")
     dec_file.add_argument("input", help="Input encrypted file")
     dec_file.add_argument("key", help="Decryption key")
     dec_file.add_argument("output", help="Output decrypted file")
 
-    args = parser.parse_args()
+    for action in ("encrypt", "decrypt"):
+        tree = subparsers.add_parser(f"{action}-tree", parents=[common],
+                                     help=f"{action.capitalize()} the changed text files of a directory tree in parallel")
+        tree.add_argument("input_dir", help="Directory tree to read")
+        tree.add_argument("key", help=f"{action.capitalize()}ion key")
+        tree.add_argument("output_dir", help="Directory the tree is written to")
+        tree.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+        tree.add_argument("--manifest", help="Change manifest (default: a manifest file in the output directory)")
 
-    if args.command == "hide-message":
-        if image_encryptor.hide_message_in_png(args.image, args.message, args.key, args.output):
-            print("Message hidden successfully")
-    elif args.command == "decode-message":
-        message = image_encryptor.decode_message_from_png(args.image, args.key)
-        print(message)
-    elif args.command == "hide-file":
-        if image_encryptor.hide_file_in_png(args.image, args.file, args.key, args.output):
-            print("File hidden successfully")
-    elif args.command == "decode-file":
-        result = image_encryptor.decode_file_from_png(args.image, args.output)
-        if result:
-            print(result)
-    elif args.command == "encrypt-text":
-        print(text_encryptor.encrypt_text(args.text, args.key))
-    elif args.command == "decrypt-text":
-        print(text_encryptor.decrypt_text(args.text, args.key))
-    elif args.command == "encrypt-file":
-        if text_encryptor.encrypt_text_file(args.input, args.key, args.output):
-            print(f"File encrypted and saved as {args.output}")
-    elif args.command == "decrypt-file":
-        if text_encryptor.decrypt_text_file(args.input, args.key, args.output):
-            print(f"File decrypted and saved as {args.output}")
+    serve = subparsers.add_parser("serve", parents=[common], help="Run a daemon that answers commands on warm workers")
+    serve_address = serve.add_mutually_exclusive_group()
+    serve_address.add_argument("--socket", metavar="PATH",
+                               help=f"Unix socket to listen on (default: ${daemon.ADDRESS_VARIABLE} or a per-user socket)")
+    serve_address.add_argument("--port", type=int, help="Listen on this localhost TCP port instead of a socket")
+    serve.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    return parser
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse ``argv`` (default: ``sys.argv[1:]``) and check the options argparse cannot check itself."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command in ("batch-hide", "batch-decode") and args.images and not args.output_dir:
+        parser.error("--output-dir is required with --images")
+    if args.command == "batch-hide" and args.images and not args.files:
+        parser.error("--files is required with --images")
+    return args
+
+
+def execute(args) -> int:
+    """Run the parsed command, printing the stage breakdown if it was requested, and return its exit status."""
+    if not (args.stats or args.stats_json):
+        return run_command(args)
+    instrumentation.enable(trace_memory=True)
+    started = time.perf_counter()
+    try:
+        status = run_command(args)
+        print_stats(args, time.perf_counter() - started)
+        return status
+    finally:
+        # A daemon worker runs many commands; do not let the records of one leak into the next.
+        instrumentation.disable()
+        instrumentation.reset()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.command in daemon.SERVED_COMMANDS and not args.no_daemon:
+        response = daemon.forward(args.command, sys.argv[2:])
+        if response is not None:
+            sys.stdout.write(response["stdout"])
+            sys.stderr.write(response["stderr"])
+            if not response["ok"]:
+                print(response["error"], file=sys.stderr)
+                sys.exit(1)
+            return
+    status = execute(args)
+    if status:
+        sys.exit(status)
 
 
 if __name__ == "__main__":
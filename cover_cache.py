@@ -0,0 +1,99 @@
+"""LRU cache of decoded cover images.
+
+Hiding many payloads in the same few template covers would otherwise decode the same PNG again for
+every call. The cache keeps the decoded pixels as read-only arrays: covers given by path are keyed by
+their real path and validated against the file's size and modification time, and covers given as
+bytes are keyed by a BLAKE2 hash of their content. A hit returns a PIL image that shares the cached
+pixels; Pillow copies them the first time the image is written to, so the cached copy never changes.
+The image's ``info`` (ICC profile, transparency, ...) is cached with the pixels and restored on a hit,
+so a cached cover is saved exactly like a freshly decoded one.
+Entries are evicted least recently used first once the cached pixels exceed ``max_bytes``.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from PIL import Image
+
+# Modes whose pixels map one-to-one onto a uint8 or uint16 array and back through ``Image.frombuffer``.
+CACHEABLE_MODES = ("L", "LA", "RGB", "RGBA", "I;16", "I;16L", "I;16B")
+
+_Entry = namedtuple("_Entry", "signature mode size pixels info")
+
+
+class CoverCache:
+    """Thread-safe LRU cache of decoded covers holding at most ``max_bytes`` of pixels."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def load(self, source, loader):
+        """Return the decoded cover for ``source`` (a path or encoded bytes), calling ``loader()`` on a miss.
+
+        Other sources, and images in modes the cache cannot share, are returned from ``loader()``
+        without being cached.
+        """
+        identity, signature = _identify(source)
+        if identity is not None:
+            with self._lock:
+                entry = self._entries.get(identity)
+                if entry is not None and entry.signature == signature:
+                    self._entries.move_to_end(identity)
+                    self.hits += 1
+                    image = Image.frombuffer(entry.mode, entry.size, entry.pixels, "raw", entry.mode, 0, 1)
+                    image.info = dict(entry.info)
+                    return image
+                self.misses += 1
+        image = loader()
+        if identity is not None and image.mode in CACHEABLE_MODES:
+            self._store(identity, _Entry(signature, image.mode, image.size, _readonly_pixels(image), dict(image.info)))
+        return image
+
+    def _store(self, identity, entry):
+        if entry.pixels.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(identity, None)
+            if previous is not None:
+                self._bytes -= previous.pixels.nbytes
+            self._entries[identity] = entry
+            self._bytes += entry.pixels.nbytes
+            while self._bytes > self.max_bytes:
+                _identity, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.pixels.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the hit, miss and eviction counters and the current number of entries and bytes."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def _identify(source):
+    """Return ``(identity, signature)`` for a cacheable ``source``, or ``(None, None)``."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return ("content", hashlib.blake2b(source, digest_size=16).digest()), None
+    if isinstance(source, (str, os.PathLike)):
+        status = os.stat(source)
+        return ("path", os.path.realpath(source)), (status.st_size, status.st_mtime_ns)
+    return None, None
+
+
+def _readonly_pixels(image):
+    pixels = np.asarray(image)
+    pixels.flags.writeable = False
+    return pixels
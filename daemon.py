@@ -0,0 +1,287 @@
+"""Long-lived local server that runs cli.py commands on warm worker processes.
+
+Starting Python and importing NumPy and Pillow dominates the run time of small requests, so
+``serve()`` keeps a pool of worker processes that have already imported the codecs and answers
+requests over a Unix domain socket (or a localhost TCP port).
+
+The protocol is JSON lines: each request is one JSON object on its own line and gets exactly one JSON
+line back. A connection may send any number of requests.
+
+    request:  {"op": "hide-file", "args": ["cover.png", "secret.bin", "key", "out.png"], "cwd": "/work"}
+    response: {"ok": true, "stdout": "File hidden successfully\\n", "stderr": ""}
+              {"ok": false, "error": "...", "stdout": "", "stderr": ""}
+
+``op`` is one of ``SERVED_COMMANDS``, ``args`` are the command line arguments that follow the
+subcommand, and relative paths are resolved against ``cwd``. ``cli.py`` forwards these commands to
+the daemon automatically when one is listening at ``daemon_address()``.
+
+A Unix socket is only accessible to the user who started the daemon. A TCP port is open to every
+local user, so a TCP daemon writes a random token to ``token_path(address)``, a file only its owner
+can read, and rejects requests whose ``"token"`` field does not match it. ``request()`` and
+``forward()`` read the token and send it.
+"""
+
+import contextlib
+import hmac
+import importlib
+import io
+import json
+import os
+import secrets
+import signal
+import socket
+import tempfile
+
+SERVED_COMMANDS = frozenset({
+    "hide-message", "decode-message", "hide-file", "decode-file",
+    "encrypt-text", "decrypt-text", "encrypt-file", "decrypt-file",
+})
+
+ADDRESS_VARIABLE = "SIMPLE_ENCRYPTOR_DAEMON"
+
+
+def daemon_address():
+    """Return the daemon address: ``$SIMPLE_ENCRYPTOR_DAEMON`` or a per-user socket in the temp directory.
+
+    A value of the form ``host:port`` selects TCP; anything else is a Unix socket path.
+    """
+    configured = os.environ.get(ADDRESS_VARIABLE)
+    if configured:
+        return parse_address(configured)
+    return os.path.join(tempfile.gettempdir(), f"simple-encryptor-{_user()}.sock")
+
+
+def token_path(address):
+    """Return the file holding the token of the TCP daemon listening on ``address`` (``(host, port)``)."""
+    return os.path.join(tempfile.gettempdir(), f"simple-encryptor-{_user()}-{address[1]}.token")
+
+
+def _user():
+    return os.getuid() if hasattr(os, "getuid") else os.getlogin()
+
+
+def parse_address(value):
+    """Return ``(host, port)`` for ``host:port`` values and the value itself for socket paths."""
+    host, separator, port = value.rpartition(":")
+    if separator and port.isdigit() and os.sep not in value:
+        return host or "127.0.0.1", int(port)
+    return value
+
+
+def _connect(address, timeout=None):
+    if isinstance(address, tuple):
+        return socket.create_connection(address, timeout=timeout)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def _write_token(path, token):
+    """Write ``token`` to a new file that only the current user can read and rename it to ``path``.
+
+    Raises ``OSError`` if ``path`` cannot be replaced, e.g. because another user created it.
+    """
+    descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".simple-encryptor-", suffix=".token")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            file.write(token)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def _read_token(address):
+    """Return the token to send to the daemon at ``address``, or ``None`` for Unix sockets.
+
+    Raises ``OSError`` if a TCP daemon's token file cannot be read.
+    """
+    if not isinstance(address, tuple):
+        return None
+    with open(token_path(address), encoding="utf-8") as file:
+        return file.read().strip()
+
+
+def _warm_up():
+    """Import every registered operation module once per worker process so requests do not pay for it.
+
+    Workers ignore Ctrl-C; the server shuts them down when it is interrupted.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import operations
+
+    for module in operations.modules():
+        importlib.import_module(module)
+
+
+def execute(request):
+    """Run one request in a worker process and return the response dict; never raises."""
+    import cli
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    response = {"ok": False}
+    try:
+        op = request.get("op")
+        if op not in SERVED_COMMANDS:
+            raise ValueError(f"Unsupported operation {op!r}")
+        arguments = [str(argument) for argument in request.get("args", [])]
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = cli.execute(cli.parse_args([op, *arguments]))
+        response["ok"] = not status
+        if status:
+            response["error"] = f"Exit status {status}"
+    except SystemExit:
+        messages = stderr.getvalue().strip().splitlines()
+        response["error"] = messages[-1] if messages else "Invalid arguments"
+    except Exception as e:
+        response["error"] = f"{type(e).__name__}: {e}"
+    response["stdout"] = stdout.getvalue()
+    response["stderr"] = stderr.getvalue()
+    return response
+
+
+def _handle(handler):
+    """Read JSON-line requests from one connection and answer each with a JSON line."""
+    for line in handler.rfile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            token = handler.server.token
+            if token is not None and not hmac.compare_digest(str(request.get("token", "")), token):
+                raise PermissionError("Missing or wrong daemon token")
+            response = handler.server.pool.submit(execute, request).result()
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}", "stdout": "", "stderr": ""}
+        handler.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        handler.wfile.flush()
+
+
+def make_server(address, workers=None):
+    """Return a server bound to ``address`` whose requests run on ``workers`` warm processes.
+
+    Raises ``RuntimeError`` if another daemon is already listening on a Unix socket ``address``; a
+    stale socket file left by a daemon that died is removed. A TCP server writes a new token to
+    ``token_path()`` of the address it is bound to (so port 0 picks a free port); raises ``OSError``
+    if that fails.
+    """
+    # Imported here: clients import this module on every command but only use request() and forward().
+    import socketserver
+    from concurrent.futures import ProcessPoolExecutor
+
+    class Handler(socketserver.StreamRequestHandler):
+        handle = _handle
+
+    if isinstance(address, tuple):
+        class TCPServer(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        server = TCPServer(address, Handler)
+        server.token = secrets.token_hex(32)
+        try:
+            _write_token(token_path(server.server_address), server.token)
+        except OSError:
+            server.server_close()
+            raise
+    else:
+        if os.path.exists(address):
+            try:
+                _connect(address, timeout=1).close()
+            except OSError:
+                os.remove(address)
+            else:
+                raise RuntimeError(f"A daemon is already listening on {address}")
+        previous_umask = os.umask(0o177)
+        try:
+            class UnixServer(socketserver.ThreadingUnixStreamServer):
+                daemon_threads = True
+
+            server = UnixServer(address, Handler)
+        finally:
+            os.umask(previous_umask)
+        server.token = None
+    workers = workers or os.cpu_count() or 1
+    server.pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+    # Start every worker now rather than on the first requests.
+    for future in [server.pool.submit(_warm_up) for _ in range(workers)]:
+        future.result()
+    return server
+
+
+def serve(address=None, workers=None):
+    """Serve requests on ``address`` (default: ``daemon_address()``) until interrupted."""
+    address = address or daemon_address()
+    server = make_server(address, workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_server(server)
+
+
+def close_server(server):
+    """Stop the worker pool, close the listening socket and remove a Unix socket file or TCP token file."""
+    server.server_close()
+    server.pool.shutdown()
+    if isinstance(server.server_address, tuple):
+        path = token_path(server.server_address)
+        ours = False
+        with contextlib.suppress(OSError), open(path, encoding="utf-8") as file:
+            ours = file.read().strip() == server.token
+        if ours:
+            os.remove(path)
+    elif os.path.exists(server.server_address):
+        os.remove(server.server_address)
+
+
+def _exchange(connection, op, args, cwd, token=None):
+    message = {"op": op, "args": list(args), "cwd": cwd or os.getcwd()}
+    if token is not None:
+        message["token"] = token
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(message).encode("utf-8") + b"\n")
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        raise ConnectionError("The daemon closed the connection")
+    return json.loads(line)
+
+
+def request(op, args, address=None, cwd=None):
+    """Send one request to the daemon and return its response dict.
+
+    Raises ``OSError`` if no daemon is listening on ``address`` or its token cannot be read.
+    """
+    address = address or daemon_address()
+    token = _read_token(address)
+    return _exchange(_connect(address), op, args, cwd, token)
+
+
+def forward(op, args, address=None):
+    """Return the daemon's response to ``op``, or ``None`` if no daemon is running.
+
+    Only a failure to connect means "no daemon"; errors after the request was sent are raised so a
+    command is never run twice.
+    """
+    address = address or daemon_address()
+    if not isinstance(address, tuple) and not os.path.exists(address):
+        return None
+    try:
+        token = _read_token(address)
+        connection = _connect(address, timeout=1)
+    except OSError:
+        return None
+    connection.settimeout(None)
+    return _exchange(connection, op, args, None, token)
@@ -1,7 +1,789 @@
+import contextlib
+import io
+import os
+import struct
+import uuid
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from PIL import Image
 import numpy as np
 
-def hide_message_in_png(image_filename, message_to_hide, key, encoded_image):
+import payload_compression
+from apng_writer import APNGWriter
+from cover_cache import CoverCache
+from scatter import SALT_SIZE, KeyedPermutation
+import instrumentation
+from instrumentation import stage
+
+# Every image written by this module starts with a fixed-size header stored in the LSBs of the first
+# ``HEADER_BITS`` channel values; the payload follows immediately after it. Images without the magic
+# are treated as the legacy layout (raw LSB stream, message terminated by the key).
+HEADER_MAGIC = b"SENC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(">4sBBBxQ")  # magic, version, flags, bits per channel, padding, payload length
+HEADER_BITS = _HEADER.size * 8
+
+# Optional header extensions follow the fixed header, in this order, when their flag is set.
+FLAG_SHARDED = 0x01
+_SHARD = struct.Struct(">16sIIQ")  # payload id, shard index, shard count, offset of the shard in the payload
+FLAG_COMPRESSED = 0x02
+_COMPRESSION = struct.Struct(">BQ")  # codec id, uncompressed payload length
+FLAG_SCATTERED = 0x04
+_SCATTER = struct.Struct(f">{SALT_SIZE}s")  # salt of the keyed slot permutation
+FLAG_CHECKSUM = 0x08
+_CHECKSUM = struct.Struct(">I")  # CRC32 of the stored (possibly compressed) payload
+FLAG_FRAMES = 0x10
+_FRAMES = struct.Struct(">I")  # number of frames the payload is spread over, this one first
+_EXTENSIONS = ((FLAG_SHARDED, _SHARD), (FLAG_COMPRESSED, _COMPRESSION), (FLAG_SCATTERED, _SCATTER),
+               (FLAG_CHECKSUM, _CHECKSUM), (FLAG_FRAMES, _FRAMES))
+_KNOWN_FLAGS = FLAG_SHARDED | FLAG_COMPRESSED | FLAG_SCATTERED | FLAG_CHECKSUM | FLAG_FRAMES
+
+PayloadHeader = namedtuple("PayloadHeader",
+                           "flags bits_per_channel length data_offset shard compression salt checksum frames")
+Shard = namedtuple("Shard", "payload_id index count offset")
+Compression = namedtuple("Compression", "codec length")
+
+MAX_BITS_PER_CHANNEL = 4
+
+# Pillow modes whose channel values are 16 bits wide. Their pixels are embedded as uint16 arrays and
+# each channel value can carry up to ``MAX_WIDE_BITS_PER_CHANNEL`` bits.
+WIDE_MODES = ("I;16", "I;16L", "I;16B")
+MAX_WIDE_BITS_PER_CHANNEL = 8
+
+# Pillow modes whose channel values are uint8 or uint16 and can carry a payload. P-mode images are
+# only accepted through ``convert_palette``.
+CARRIER_MODES = ("L", "LA", "RGB", "RGBA") + WIDE_MODES
+
+# Working memory, in bytes, for the bands of rows copied out of an image while embedding or extracting.
+TILE_BUDGET = 64 << 20
+
+# Decoded covers reused across hide calls; ``None`` until ``enable_cover_cache()`` is called.
+_cover_cache = None
+
+def _max_bits_per_channel(depth):
+    """Return the largest embedding mode for channel values of ``depth`` bits (8 or 16)."""
+    return MAX_WIDE_BITS_PER_CHANNEL if depth == 16 else MAX_BITS_PER_CHANNEL
+
+def _check_mode(image, allow_palette=False):
+    """Raise ``ValueError`` unless the PIL ``image`` is in one of ``CARRIER_MODES`` (or P with ``allow_palette``)."""
+    if image.mode == "P":
+        if not allow_palette:
+            raise ValueError("Indexed color mode (P) is not supported")
+    elif image.mode not in CARRIER_MODES:
+        raise ValueError(f"Image mode {image.mode} is not supported; use L, LA, RGB, RGBA or 16-bit grayscale")
+
+def _check_bits_per_channel(bits_per_channel, depth=8):
+    """Raise ``ValueError`` unless ``bits_per_channel`` is a supported embedding mode for ``depth``-bit channels."""
+    limit = _max_bits_per_channel(depth)
+    if not 1 <= bits_per_channel <= limit:
+        raise ValueError(f"bits_per_channel must be between 1 and {limit} for {depth}-bit channels")
+
+def _slot_values(bits, bits_per_channel):
+    """Return ``bits`` grouped into one ``bits_per_channel``-bit value per channel; a short final group is zero-padded."""
+    if bits_per_channel == 1:
+        return bits
+    padded = np.zeros(-(-bits.size // bits_per_channel) * bits_per_channel, dtype=np.uint8)
+    padded[:bits.size] = bits
+    return np.packbits(padded.reshape(-1, bits_per_channel), axis=1).reshape(-1) >> (8 - bits_per_channel)
+
+def _value_bits(values, bits_per_channel):
+    """Return the bits of the ``bits_per_channel``-bit ``values``, most significant first; the inverse of ``_slot_values``."""
+    if bits_per_channel == 1:
+        return values
+    shifts = np.arange(bits_per_channel - 1, -1, -1, dtype=np.uint8)
+    return ((values.astype(np.uint8, copy=False)[:, None] >> shifts) & 1).reshape(-1)
+
+def _write_bits(flat, offset, bits, bits_per_channel=1):
+    """Write ``bits`` into the low ``bits_per_channel`` bits of ``flat`` in place, starting at channel ``offset``.
+
+    A final group shorter than ``bits_per_channel`` is padded with zero bits.
+    """
+    values = _slot_values(bits, bits_per_channel)
+    target = flat[offset:offset + values.size]
+    target &= np.invert(flat.dtype.type((1 << bits_per_channel) - 1))
+    target |= values
+
+def _read_bits(flat, offset, start, stop, bits_per_channel=1):
+    """Return bits ``start:stop`` of the data stored ``bits_per_channel`` bits per channel from channel ``offset``."""
+    first = offset + start // bits_per_channel
+    last = offset + -(-stop // bits_per_channel)
+    values = flat[first:last] & ((1 << bits_per_channel) - 1)
+    if bits_per_channel == 1:
+        return values
+    skip = start % bits_per_channel
+    return _value_bits(values, bits_per_channel)[skip:skip + stop - start]
+
+def _chunk_slots(tile_budget, bits_per_channel=1):
+    """Return how many channel values to unpack at a time so their bits take about an eighth of ``tile_budget``.
+
+    The result is a multiple of 8, so chunks aligned to it start on a byte boundary of the data.
+    """
+    return max(8, tile_budget // (8 * bits_per_channel) // 8 * 8)
+
+def _extract_bytes(flat, start, stop):
+    """Return bytes ``start:stop`` of the LSB stream of ``flat``."""
+    return np.packbits(flat[start * 8:stop * 8] & 1).tobytes()
+
+def _write_region(flat, start, data, data_offset, bits_per_channel=1, chunk_slots=1 << 22):
+    """Write the part of ``data`` that falls inside ``flat``.
+
+    ``data`` is stored ``bits_per_channel`` bits per channel value from channel ``data_offset`` of the
+    image, and ``flat`` holds the channels from ``start`` onwards. Bits are unpacked at most
+    ``chunk_slots`` channel values at a time.
+    """
+    total_bits = len(data) * 8
+    first = max(start, data_offset)
+    last = min(start + flat.size, data_offset + -(-total_bits // bits_per_channel))
+    for slot in range(first, last, chunk_slots):
+        bit_start = (slot - data_offset) * bits_per_channel
+        bit_stop = min((min(slot + chunk_slots, last) - data_offset) * bits_per_channel, total_bits)
+        byte_start = bit_start // 8
+        chunk = np.frombuffer(data, dtype=np.uint8, count=-(-bit_stop // 8) - byte_start, offset=byte_start)
+        bits = np.unpackbits(chunk)[bit_start - byte_start * 8:bit_stop - byte_start * 8]
+        _write_bits(flat, slot - start, bits, bits_per_channel)
+
+def _read_region(flat, start, data_offset, total_bits, bits_per_channel=1):
+    """Return the bits of the data stored from channel ``data_offset`` that fall inside ``flat``.
+
+    ``flat`` holds the channels from ``start`` onwards; the data is ``total_bits`` bits long.
+    """
+    first = max(start, data_offset)
+    last = min(start + flat.size, data_offset + -(-total_bits // bits_per_channel))
+    if first >= last:
+        return np.zeros(0, dtype=np.uint8)
+    bit_start = (first - data_offset) * bits_per_channel
+    bit_stop = min((last - data_offset) * bits_per_channel, total_bits)
+    return _read_bits(flat, data_offset - start, bit_start, bit_stop, bits_per_channel)
+
+def _write_scattered(flat, payload, data_offset, bits_per_channel, permutation, chunk_slots=1 << 20):
+    """Write ``payload`` into the channels ``data_offset + permutation(i)`` of ``flat``, ``bits_per_channel`` bits each.
+
+    Positions are generated ``chunk_slots`` at a time, so the work and memory depend only on the payload.
+    """
+    total_bits = len(payload) * 8
+    mask = np.invert(flat.dtype.type((1 << bits_per_channel) - 1))
+    # ``chunk_slots`` is a multiple of 8, so every chunk starts on a byte boundary of the payload.
+    for first in range(0, -(-total_bits // bits_per_channel), chunk_slots):
+        bit_start = first * bits_per_channel
+        bit_stop = min(bit_start + chunk_slots * bits_per_channel, total_bits)
+        chunk = np.frombuffer(payload, dtype=np.uint8, count=-(-bit_stop // 8) - bit_start // 8, offset=bit_start // 8)
+        values = _slot_values(np.unpackbits(chunk)[:bit_stop - bit_start], bits_per_channel)
+        positions = data_offset + permutation.positions(first, first + values.size)
+        flat[positions] = (flat[positions] & mask) | values
+
+def _iter_scattered(flat, header, permutation, chunk_slots=1 << 20):
+    """Yield the payload written by ``_write_scattered`` as described by ``header``, chunk by chunk."""
+    total_bits = header.length * 8
+    bits_per_channel = header.bits_per_channel
+    for first in range(0, -(-total_bits // bits_per_channel), chunk_slots):
+        bit_start = first * bits_per_channel
+        bit_stop = min(bit_start + chunk_slots * bits_per_channel, total_bits)
+        count = -(-(bit_stop - bit_start) // bits_per_channel)
+        positions = header.data_offset + permutation.positions(first, first + count)
+        values = flat[positions] & ((1 << bits_per_channel) - 1)
+        yield np.packbits(_value_bits(values, bits_per_channel)[:bit_stop - bit_start]).tobytes()
+
+def _header_size(flags=0):
+    """Return the size in bytes of the header, including the extensions selected by ``flags``."""
+    return _HEADER.size + sum(extension.size for flag, extension in _EXTENSIONS if flags & flag)
+
+MAX_HEADER_BITS = _header_size(_KNOWN_FLAGS) * 8
+
+def _capacity_bytes(slots, bits_per_channel=1, flags=0):
+    """Return how many payload bytes fit in ``slots`` channel values after the header."""
+    return max(0, (slots - _header_size(flags) * 8) * bits_per_channel // 8)
+
+def _pack_header(payload_length, flags=0, bits_per_channel=1, shard=None, compression=None, salt=None, checksum=None,
+                 frames=None):
+    """Return the header bytes describing a payload of ``payload_length`` bytes."""
+    header = _HEADER.pack(HEADER_MAGIC, FORMAT_VERSION, flags, bits_per_channel, payload_length)
+    if flags & FLAG_SHARDED:
+        header += _SHARD.pack(*shard)
+    if flags & FLAG_COMPRESSED:
+        header += _COMPRESSION.pack(*compression)
+    if flags & FLAG_SCATTERED:
+        header += _SCATTER.pack(salt)
+    if flags & FLAG_CHECKSUM:
+        header += _CHECKSUM.pack(checksum)
+    if flags & FLAG_FRAMES:
+        header += _FRAMES.pack(frames)
+    return header
+
+def _read_header(flat, slots):
+    """Return the ``PayloadHeader`` stored at the start of ``flat``, or ``None`` for legacy images.
+
+    ``flat`` must hold at least the first ``MAX_HEADER_BITS`` channel values (or the whole image if it is
+    smaller) and ``slots`` is the number of channel values in the whole image. The payload length is
+    not checked against ``slots`` for payloads spread over several frames. Raises ``ValueError`` if the
+    header is present but unusable.
+    """
+    if flat.size < HEADER_BITS:
+        return None
+    magic, version, flags, bits_per_channel, length = _HEADER.unpack(_extract_bytes(flat, 0, _HEADER.size))
+    if magic != HEADER_MAGIC:
+        return None
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported payload format version {version}")
+    if flags & ~_KNOWN_FLAGS:
+        raise ValueError(f"Unsupported payload flags {flags:#04x}")
+    if flat.size < _header_size(flags) * 8:
+        raise ValueError("Corrupt payload header")
+    depth = flat.dtype.itemsize * 8
+    if not 1 <= bits_per_channel <= _max_bits_per_channel(depth):
+        raise ValueError("Corrupt payload header")
+    if not flags & FLAG_FRAMES and length > _capacity_bytes(slots, bits_per_channel, flags):
+        raise ValueError("Corrupt payload header")
+
+    offset = _HEADER.size
+    shard = compression = salt = checksum = frames = None
+    if flags & FLAG_SHARDED:
+        shard = Shard(*_SHARD.unpack(_extract_bytes(flat, offset, offset + _SHARD.size)))
+        if shard.index >= shard.count:
+            raise ValueError("Corrupt payload header")
+        offset += _SHARD.size
+    if flags & FLAG_COMPRESSED:
+        compression = Compression(*_COMPRESSION.unpack(_extract_bytes(flat, offset, offset + _COMPRESSION.size)))
+        if compression.codec not in payload_compression.CODECS.values():
+            raise ValueError(f"Unsupported compression codec {compression.codec}")
+        offset += _COMPRESSION.size
+    if flags & FLAG_SCATTERED:
+        salt, = _SCATTER.unpack(_extract_bytes(flat, offset, offset + _SCATTER.size))
+        offset += _SCATTER.size
+    if flags & FLAG_CHECKSUM:
+        checksum, = _CHECKSUM.unpack(_extract_bytes(flat, offset, offset + _CHECKSUM.size))
+        offset += _CHECKSUM.size
+    if flags & FLAG_FRAMES:
+        frames, = _FRAMES.unpack(_extract_bytes(flat, offset, offset + _FRAMES.size))
+        if frames < 1:
+            raise ValueError("Corrupt payload header")
+    return PayloadHeader(flags, bits_per_channel, length, _header_size(flags) * 8, shard, compression, salt,
+                         checksum, frames)
+
+def _end_slot(header):
+    """Return the channel value just past the payload described by ``header``."""
+    return header.data_offset + -(-header.length * 8 // header.bits_per_channel)
+
+def _rows_for(image, slots):
+    """Return how many rows of ``image`` hold the first ``slots`` channel values."""
+    return min(image.height, -(-slots // (image.width * len(image.getbands()))))
+
+def _channel_depth(image):
+    """Return the width in bits (8 or 16) of the channel values of the PIL ``image``."""
+    return 16 if image.mode in WIDE_MODES else 8
+
+def _band_rows(image, tile_budget):
+    """Return how many rows of ``image`` fit in ``tile_budget`` bytes; the first band always covers the header.
+
+    Converting a band to an array briefly holds it twice (Pillow's raw bytes and the array), so a
+    band takes at most half the budget.
+    """
+    row_bytes = image.width * len(image.getbands()) * _channel_depth(image) // 8
+    return max(1, tile_budget // (2 * row_bytes), _rows_for(image, MAX_HEADER_BITS))
+
+def _iter_bands(image, band_rows, stop_slot=None):
+    """Yield ``(top_row, first_slot, band)`` for horizontal bands of ``image`` as writable arrays.
+
+    Iteration stops after the band containing channel value ``stop_slot - 1``.
+    """
+    row_slots = image.width * len(image.getbands())
+    stop_row = image.height if stop_slot is None else _rows_for(image, stop_slot)
+    for top in range(0, stop_row, band_rows):
+        bottom = min(top + band_rows, stop_row)
+        with stage("to-array", (bottom - top) * row_slots):
+            band = np.array(image.crop((0, top, image.width, bottom)))
+        yield top, top * row_slots, band
+
+def _open_rows(image_filename, rows):
+    """Open ``image_filename`` and decode only its first ``rows`` rows where the format allows it.
+
+    Non-interlaced PNG rows are stored top to bottom, so shrinking the decode extent makes Pillow stop
+    after the rows that were asked for. This relies on Pillow's ``tile`` and ``_size`` attributes,
+    which are not public API: if they no longer behave as expected, the image is decoded completely
+    instead. ``tests/test_image_encryptor.py`` checks that the shortcut still takes effect. Other
+    images are decoded completely.
+    """
+    image = Image.open(image_filename)
+    if rows >= image.height or image.format != "PNG" or image.info.get("interlace") or len(image.tile) != 1:
+        return image
+    width = image.width
+    try:
+        codec, _extents, offset, args = image.tile[0]
+        image._size = (width, rows)
+        image.tile = [(codec, (0, 0, width, rows), offset, args)]
+        image.load()
+    except (AttributeError, TypeError, ValueError):
+        image = None
+    if image is None or image.size != (width, rows):
+        image = Image.open(image_filename)
+    return image
+
+def _image_header(image, slots=None):
+    """Return the ``PayloadHeader`` of the PIL ``image`` (``None`` for legacy images), reading only its top rows.
+
+    ``slots`` is the channel count of the whole image when ``image`` holds only its first rows.
+    """
+    _check_mode(image, allow_palette=True)
+    if slots is None:
+        slots = image.width * image.height * len(image.getbands())
+    top = image.crop((0, 0, image.width, _rows_for(image, MAX_HEADER_BITS)))
+    return _read_header(np.asarray(top).reshape(-1), slots)
+
+def _load_header(image_filename):
+    """Return ``(image, header, decoded)`` for ``image_filename``, decoding only the rows that hold the header.
+
+    When the format only allows decoding the whole image (anything but a non-interlaced PNG),
+    ``decoded`` is true and ``image`` is that decoded image, ready to be reused for the payload.
+    Otherwise ``image`` is the closed, undecoded image, for its size, mode and format. ``header`` is
+    ``None`` for legacy images.
+    """
+    with stage("load-header"):
+        with Image.open(image_filename) as image:
+            slots = image.width * image.height * len(image.getbands())
+        top = _open_rows(image_filename, _rows_for(image, MAX_HEADER_BITS))
+        header = _image_header(top, slots)
+        if top.size == image.size:
+            return top, header, True
+        return image, header, False
+
+def _open_payload(image_filename):
+    """Return ``(image, header)`` for ``image_filename``, decoding only the rows up to the end of the payload.
+
+    ``image_filename`` may also be a seekable file object. ``header`` is ``None`` for legacy images,
+    which are decoded completely, as are images holding a scattered payload. An image that had to
+    be decoded completely to read the header is not decoded again.
+    """
+    image, header, decoded = _load_header(image_filename)
+    if decoded:
+        return image, header
+    with stage("load"):
+        if header is None or header.flags & FLAG_SCATTERED:
+            image = Image.open(image_filename)
+        else:
+            image = _open_rows(image_filename, _rows_for(image, _end_slot(header)))
+        image.load()
+    return image, header
+
+def _pack_bits(pending, bits):
+    """Return ``(data, pending)``: the whole bytes of ``pending`` followed by ``bits``, and the fewer than 8 bits left over."""
+    if pending.size:
+        bits = np.concatenate((pending, bits))
+    whole = bits.size - bits.size % 8
+    return np.packbits(bits[:whole]).tobytes(), bits[whole:].copy()
+
+def _iter_payload(image, header, tile_budget):
+    """Yield the payload described by ``header`` band by band, reading only the rows that hold it.
+
+    The bits of each band are unpacked ``_chunk_slots(tile_budget)`` channel values at a time.
+    """
+    total_bits = header.length * 8
+    chunk_slots = _chunk_slots(tile_budget, header.bits_per_channel)
+    pending = np.zeros(0, dtype=np.uint8)
+    for _top, start, band in _iter_bands(image, _band_rows(image, tile_budget), _end_slot(header)):
+        flat = band.reshape(-1)
+        for first in range(0, flat.size, chunk_slots):
+            with stage("extract", min(chunk_slots, flat.size - first) * flat.itemsize):
+                bits = _read_region(flat[first:first + chunk_slots], start + first, header.data_offset, total_bits,
+                                    header.bits_per_channel)
+                data, pending = _pack_bits(pending, bits)
+            if data:
+                yield data
+
+def _iter_lsb_bytes(image, tile_budget):
+    """Yield the whole LSB stream of ``image`` band by band; a trailing partial byte keeps its raw bit value."""
+    chunk_slots = _chunk_slots(tile_budget)
+    pending = np.zeros(0, dtype=np.uint8)
+    for _top, _start, band in _iter_bands(image, _band_rows(image, tile_budget)):
+        flat = band.reshape(-1)
+        for first in range(0, flat.size, chunk_slots):
+            with stage("extract", min(chunk_slots, flat.size - first) * flat.itemsize):
+                data, pending = _pack_bits(pending, (flat[first:first + chunk_slots] & 1).astype(np.uint8, copy=False))
+            if data:
+                yield data
+    if pending.size:
+        yield _partial_byte(pending)
+
+def _partial_byte(bits):
+    """Return the fewer than 8 ``bits`` as one byte holding their raw value."""
+    return bytes([int(bits.astype(np.int64) @ (1 << np.arange(bits.size - 1, -1, -1)))])
+
+def _carrier_layout(image_filename):
+    """Return ``(slots, depth)``: the number of channel values in ``image_filename`` and their width in bits.
+
+    The pixels are not decoded.
+    """
+    with Image.open(image_filename) as image:
+        _check_mode(image)
+        return image.width * image.height * len(image.getbands()), _channel_depth(image)
+
+def _byte_view(data):
+    """Return the bytes-like ``data`` as a flat memoryview of bytes, without copying."""
+    view = memoryview(data)
+    return view if view.format == "B" and view.ndim == 1 else view.cast("B")
+
+def _channels(array):
+    """Return the channel values of the image ``array`` as a flat array (a view when it is contiguous).
+
+    Raises ``ValueError`` unless ``array`` is uint8 or uint16 with shape ``(height, width)`` or
+    ``(height, width, channels)``.
+    """
+    if array.dtype.kind != "u" or array.dtype.itemsize not in (1, 2) or array.ndim not in (2, 3):
+        raise ValueError("Image arrays must be uint8 or uint16 with shape (height, width) or (height, width, channels)")
+    return array.reshape(-1)
+
+def _palette_pixels(image):
+    """Return the P-mode ``image`` as an RGB array, or RGBA if it has transparency, with one palette lookup."""
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    colors = np.asarray(image.getpalette("RGB") or [], dtype=np.uint8).reshape(-1, 3)
+    palette[:len(colors)] = colors
+    transparency = image.info.get("transparency")
+    if transparency is not None:
+        alpha = np.full((256, 1), 255, dtype=np.uint8)
+        if isinstance(transparency, int):
+            alpha[transparency] = 0
+        else:
+            alpha[:len(transparency), 0] = np.frombuffer(transparency, dtype=np.uint8)
+        palette = np.hstack((palette, alpha))
+    return palette[np.asarray(image)]
+
+def _plan_embedding(slots, payload_length, bits_per_channel, what, shard, compression, scatter_key, depth=8,
+                    checksum=None):
+    """Return ``(header, end_slot, permutation)`` for hiding ``payload_length`` bytes in ``slots`` channel values.
+
+    ``depth`` is the width in bits of the channel values and ``checksum`` the CRC32 of the payload to
+    record, if any. ``permutation`` is ``None`` unless ``scatter_key`` asks for scattered embedding,
+    and ``end_slot`` is only meaningful without it. Raises ``ValueError`` if the payload does not fit;
+    ``what`` names the payload in error messages.
+    """
+    _check_bits_per_channel(bits_per_channel, depth)
+    flags = (FLAG_SHARDED if shard is not None else 0) | (FLAG_COMPRESSED if compression is not None else 0)
+    if checksum is not None:
+        flags |= FLAG_CHECKSUM
+    salt = permutation = None
+    if scatter_key is not None:
+        flags |= FLAG_SCATTERED
+        salt = os.urandom(SALT_SIZE)
+    if slots < _header_size(flags) * 8 or payload_length > _capacity_bytes(slots, bits_per_channel, flags):
+        raise ValueError(f"Not enough space in the image to hide the {what}")
+    header = _pack_header(payload_length, flags, bits_per_channel, shard, compression, salt, checksum)
+    data_offset = len(header) * 8
+    if scatter_key is not None:
+        permutation = KeyedPermutation(scatter_key, salt, slots - data_offset)
+    return header, data_offset + -(-payload_length * 8 // bits_per_channel), permutation
+
+def _payload_checksum(payload):
+    """Return the CRC32 of the bytes-like ``payload``."""
+    with stage("checksum", len(payload)):
+        return zlib.crc32(payload)
+
+def _embed_array(array, payload, bits_per_channel=1, what="payload", shard=None, compression=None, scatter_key=None,
+                 checksum=False):
+    """Hide ``payload`` in the uint8 or uint16 image ``array`` in place and return it.
+
+    With ``checksum`` the CRC32 of ``payload`` is recorded in the header. Raises ``ValueError``; ``what``
+    names the payload in error messages.
+    """
+    payload = _byte_view(payload)
+    flat = _channels(array)
+    header, _end, permutation = _plan_embedding(flat.size, len(payload), bits_per_channel, what, shard, compression,
+                                                scatter_key, flat.dtype.itemsize * 8,
+                                                _payload_checksum(payload) if checksum else None)
+    with stage("embed", len(payload)):
+        _write_region(flat, 0, header, 0)
+        if permutation is None:
+            _write_region(flat, 0, payload, len(header) * 8, bits_per_channel)
+        else:
+            _write_scattered(flat, payload, len(header) * 8, bits_per_channel, permutation)
+        if not array.flags.c_contiguous:
+            # ``reshape`` had to copy; write the result back into the caller's array.
+            array[...] = flat.reshape(array.shape)
+    return array
+
+def _iter_array_payload(flat, header, chunk_slots=1 << 22):
+    """Yield the payload described by ``header`` from the channel values ``flat``, ``chunk_slots`` values at a time.
+
+    Legacy images (``header`` is ``None``) yield their whole LSB stream, like ``_iter_lsb_bytes``.
+    """
+    if header is None:
+        whole = flat.size - flat.size % 8
+        for start in range(0, whole, chunk_slots):
+            yield np.packbits(flat[start:min(start + chunk_slots, whole)] & 1).tobytes()
+        if whole < flat.size:
+            yield _partial_byte(flat[whole:] & 1)
+        return
+    # ``data_offset`` and ``chunk_slots`` are multiples of 8, so every chunk holds whole bytes.
+    total_bits = header.length * 8
+    for start in range(header.data_offset, _end_slot(header), chunk_slots):
+        bits = _read_region(flat[start:start + chunk_slots], start, header.data_offset, total_bits,
+                            header.bits_per_channel)
+        yield np.packbits(bits).tobytes()
+
+def _embed_image(image, payload, bits_per_channel=1, what="payload", shard=None, tile_budget=TILE_BUDGET,
+                 compression=None, scatter_key=None, convert_palette=False, checksum=False):
+    """Hide ``payload`` in the PIL ``image`` in place and return it.
+
+    Only the bands of rows that hold the header and payload are copied out, modified and pasted back,
+    and the payload bits of a band are unpacked ``_chunk_slots(tile_budget)`` channel values at a time,
+    so the working memory beyond the decoded image stays below twice ``tile_budget`` bytes. Scattered
+    payloads can land in any row, so the whole image is copied out once instead. With
+    ``convert_palette``, a P-mode ``image`` is expanded into a new RGB(A) array by a palette lookup,
+    the payload is embedded there and a new image sharing that array is returned. With ``checksum``
+    the CRC32 of ``payload`` is recorded in the header. Raises ``ValueError``; ``what`` names the
+    payload in error messages.
+    """
+    _check_mode(image, convert_palette)
+    if image.mode == "P":
+        with stage("convert", image.width * image.height):
+            pixels = _palette_pixels(image)
+        _embed_array(pixels, payload, bits_per_channel, what, shard, compression, scatter_key, checksum)
+        mode = "RGB" if pixels.shape[2] == 3 else "RGBA"
+        return Image.frombuffer(mode, image.size, pixels, "raw", mode, 0, 1)
+
+    payload = _byte_view(payload)
+    slots = image.width * image.height * len(image.getbands())
+    header, end_slot, permutation = _plan_embedding(slots, len(payload), bits_per_channel, what, shard, compression,
+                                                    scatter_key, _channel_depth(image),
+                                                    _payload_checksum(payload) if checksum else None)
+    data_offset = len(header) * 8
+    if permutation is not None:
+        with stage("to-array", slots):
+            pixels = np.array(image)
+        with stage("embed", len(payload)):
+            flat = pixels.reshape(-1)
+            _write_region(flat, 0, header, 0)
+            _write_scattered(flat, payload, data_offset, bits_per_channel, permutation)
+        with stage("from-array", slots):
+            image.paste(Image.frombuffer(image.mode, image.size, pixels, "raw", image.mode, 0, 1))
+        return image
+    band_rows = _band_rows(image, tile_budget)
+    for top, start, band in _iter_bands(image, band_rows, end_slot):
+        with stage("embed", band.nbytes):
+            flat = band.reshape(-1)
+            _write_region(flat, start, header, 0)
+            _write_region(flat, start, payload, data_offset, bits_per_channel,
+                          _chunk_slots(tile_budget, bits_per_channel))
+        with stage("from-array", band.nbytes):
+            band_image = Image.frombuffer(image.mode, (image.width, band.shape[0]), band, "raw", image.mode, 0, 1)
+            image.paste(band_image, (0, top))
+    return image
+
+def _source(image):
+    """Return something ``Image.open`` accepts for ``image`` given as encoded bytes, a file object or a path."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    return image
+
+def _decode_image(image):
+    loaded = Image.open(_source(image))
+    loaded.load()
+    return loaded
+
+def _load_image(image):
+    """Open and decode the cover ``image`` given as encoded bytes, a file object or a path.
+
+    With the cover cache enabled, covers seen before are served from it; the returned image is then
+    copied by Pillow when it is first modified.
+    """
+    with stage("load"):
+        if _cover_cache is None:
+            return _decode_image(image)
+        return _cover_cache.load(image, lambda: _decode_image(image))
+
+def _hide(image, payload, bits_per_channel=1, what="payload", shard=None, tile_budget=TILE_BUDGET, compression=None,
+          scatter_key=None, convert_palette=False, checksum=False):
+    """Hide ``payload`` in ``image`` given as anything ``hide_bytes_in_image`` accepts.
+
+    Arrays and PIL images are modified in place and returned (palette images converted with
+    ``convert_palette`` are returned as a new image); other inputs are decoded and the encoded image is
+    returned as PNG bytes. Raises ``FileNotFoundError`` or ``ValueError``.
+    """
+    if isinstance(image, np.ndarray):
+        return _embed_array(image, payload, bits_per_channel, what, shard, compression, scatter_key, checksum)
+    if isinstance(image, Image.Image):
+        return _embed_image(image, payload, bits_per_channel, what, shard, tile_budget, compression, scatter_key,
+                            convert_palette, checksum)
+    cover = _embed_image(_load_image(image), payload, bits_per_channel, what, shard, tile_budget, compression,
+                         scatter_key, convert_palette, checksum)
+    output = io.BytesIO()
+    with stage("save"):
+        cover.save(output, "PNG")
+    return output.getvalue()
+
+def _compress(source, compression, compression_level):
+    """Return ``(payload, Compression or None)`` for ``source`` (bytes-like or a binary file object).
+
+    ``compression`` is ``None`` or a codec accepted by ``payload_compression.compress``. File objects
+    are read to the end.
+    """
+    if compression is None:
+        if hasattr(source, "read"):
+            with stage("read") as timer:
+                source = source.read()
+                timer.nbytes = len(source)
+        return source, None
+    data, codec, length = payload_compression.compress(source, compression, compression_level)
+    return data, None if codec is None else Compression(codec, length)
+
+def _stored_chunks(image, tile_budget=TILE_BUDGET, key=None):
+    """Return ``(header, chunks)`` for ``image`` given as anything ``decode_bytes_from_image`` accepts.
+
+    ``chunks`` yields the payload piece by piece as it is stored, still compressed if it was; for legacy
+    images ``header`` is ``None`` and ``chunks`` yields the whole LSB stream. ``key`` is needed for
+    scattered payloads. Raises ``FileNotFoundError`` or ``ValueError``.
+    """
+    flat = None
+    if isinstance(image, np.ndarray):
+        flat = _channels(image)
+        header = _read_header(flat[:MAX_HEADER_BITS], flat.size)
+    else:
+        if isinstance(image, Image.Image):
+            header = _image_header(image)
+        else:
+            image, header = _open_payload(_source(image))
+        if header is None:
+            return None, _iter_lsb_bytes(image, tile_budget)
+
+    if header is not None and header.flags & FLAG_FRAMES:
+        raise ValueError(f"The payload is spread over {header.frames} frames; decode it with decode_file_from_frames")
+    if header is not None and header.flags & FLAG_SCATTERED:
+        if key is None:
+            raise ValueError("The payload is scattered with a key; the key is needed to decode it")
+        if flat is None:
+            with stage("to-array"):
+                flat = np.asarray(image).reshape(-1)
+        chunks = _iter_scattered(flat, header, KeyedPermutation(key, header.salt, flat.size - header.data_offset))
+    elif flat is not None:
+        chunks = _iter_array_payload(flat, header)
+    else:
+        chunks = _iter_payload(image, header, tile_budget)
+    return header, chunks
+
+def _payload_chunks(image, tile_budget=TILE_BUDGET, key=None):
+    """Return ``(header, chunks)`` like ``_stored_chunks``, with compressed payloads decompressed on the fly."""
+    header, chunks = _stored_chunks(image, tile_budget, key)
+    if header is not None and header.compression is not None:
+        chunks = payload_compression.iter_decompress(chunks, *header.compression)
+    return header, chunks
+
+def _hide_payload(image_filename, payload, encoded_image, bits_per_channel, what, shard=None,
+                  tile_budget=TILE_BUDGET, compression=None, scatter_key=None, convert_palette=False, checksum=False):
+    """Hide ``payload`` in ``image_filename`` and save the result as ``encoded_image``.
+
+    Raises ``FileNotFoundError`` or ``ValueError``; ``what`` names the payload in error messages.
+    """
+    image = _hide(_load_image(image_filename), payload, bits_per_channel, what, shard, tile_budget, compression,
+                  scatter_key, convert_palette, checksum)
+    with stage("save"):
+        image.save(encoded_image)
+
+def _decode_legacy_message(chunks, key):
+    """Return the message preceding ``key`` in the LSB stream ``chunks`` of a legacy image, or ``None``."""
+    try:
+        key_bytes = key.encode("latin-1")
+    except UnicodeEncodeError:
+        # Every decoded character is below U+0100, so such a key can never match.
+        return None
+
+    message = bytearray()
+    for chunk in chunks:
+        search_from = max(0, len(message) + 1 - max(len(key_bytes), 1))
+        message += chunk
+        index = message.find(key_bytes, search_from)
+        if index != -1:
+            return message[:index].decode("latin-1")
+    return None
+
+def hide_bytes_in_image(image, data, bits_per_channel=1, tile_budget=TILE_BUDGET, compression=None,
+                        compression_level=None, scatter_key=None, convert_palette=False, checksum=False):
+    """
+    The function `hide_bytes_in_image` hides a payload in an image held in memory, for callers that
+    receive and send images as buffers rather than files.
+
+    :param image: The cover image: encoded image bytes (or a bytearray/memoryview), a file object, a
+    path, a `PIL.Image.Image`, or a uint8 or uint16 NumPy array of shape (height, width) or (height,
+    width, channels). Grayscale, LA and 16-bit images are embedded as they are, without conversion
+    :param data: The payload, any bytes-like object (bytes, bytearray, memoryview, NumPy array). It is
+    read in place, not copied
+    :param bits_per_channel: How many low bits of each channel value carry the payload (1-4, or 1-8 for
+    16-bit images)
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param compression: None to store the payload as it is, or "zlib", "bz2", "lzma" to compress it first;
+    "auto" uses zlib only when that makes the payload smaller. Decoding decompresses automatically
+    :param compression_level: The compression level (0-9, 1-9 for bz2), or None for the codec default
+    :param scatter_key: None to fill the image from the top, or a key that selects pseudo-random channel
+    values spread over the whole image for the payload; the same key is needed to decode it
+    :param convert_palette: Whether to expand palette (P) images to RGB, or RGBA if they have
+    transparency, instead of rejecting them
+    :param checksum: Whether to record a CRC32 of the stored payload in the header, so `verify_image`
+    can check the payload without decoding it
+    :return: the same array or PIL image, modified in place, when one was given (a converted palette
+    image is returned as a new RGB(A) image); otherwise the encoded image as PNG bytes. Raises ValueError if the payload does not fit or the image is not supported,
+    and FileNotFoundError for a missing path.
+    """
+    payload, compression = _compress(data, compression, compression_level)
+    return _hide(image, payload, bits_per_channel, "payload", tile_budget=tile_budget, compression=compression,
+                 scatter_key=scatter_key, convert_palette=convert_palette, checksum=checksum)
+
+def decode_bytes_from_image(image, tile_budget=TILE_BUDGET, scatter_key=None):
+    """
+    The function `decode_bytes_from_image` extracts the payload hidden by `hide_bytes_in_image` (or by
+    `hide_file_in_png`) from an image held in memory.
+
+    :param image: The encoded image, in any of the forms accepted by `hide_bytes_in_image`
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param scatter_key: The key of a scattered payload; not needed otherwise
+    :return: the payload as bytes. Images produced by older versions (no header) return their whole
+    LSB stream. Raises ValueError for a corrupt header or a scattered payload without its key, and
+    FileNotFoundError for a missing path.
+    """
+    _header, chunks = _payload_chunks(image, tile_budget, scatter_key)
+    return b''.join(chunks)
+
+def hide_message_in_image(image, message_to_hide, key, bits_per_channel=1, tile_budget=TILE_BUDGET, compression=None,
+                          compression_level=None, scatter=False, convert_palette=False, checksum=False):
+    """
+    The function `hide_message_in_image` is the in-memory counterpart of `hide_message_in_png`.
+
+    :param image: The cover image, in any of the forms accepted by `hide_bytes_in_image`
+    :param message_to_hide: The message to hide
+    :param key: The key appended to the message, needed to decode it
+    :param bits_per_channel: How many low bits of each channel value carry the message (1-4, or 1-8 for
+    16-bit images)
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param compression: The compression, as for `hide_bytes_in_image`
+    :param compression_level: The compression level, as for `hide_bytes_in_image`
+    :param scatter: Whether `key` also scatters the message over the image, as for `hide_bytes_in_image`
+    :param convert_palette: Whether to convert palette images, as for `hide_bytes_in_image`
+    :param checksum: Whether to record a checksum, as for `hide_bytes_in_image`
+    :return: as for `hide_bytes_in_image`. Raises ValueError if the message does not fit.
+    """
+    payload, compression = _compress((message_to_hide + key).encode("utf-8"), compression, compression_level)
+    return _hide(image, payload, bits_per_channel, "message", tile_budget=tile_budget, compression=compression,
+                 scatter_key=key if scatter else None, convert_palette=convert_palette, checksum=checksum)
+
+def decode_message_from_image(image, key, tile_budget=TILE_BUDGET):
+    """
+    The function `decode_message_from_image` is the in-memory counterpart of `decode_message_from_png`.
+
+    :param image: The encoded image, in any of the forms accepted by `hide_bytes_in_image`
+    :param key: The key the message was hidden with
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :return: the decoded message, or None if no message hidden with `key` was found. Raises ValueError
+    for a corrupt header.
+    """
+    header, chunks = _payload_chunks(image, tile_budget, key)
+    if header is None:
+        return _decode_legacy_message(chunks, key)
+    payload = b''.join(chunks)
+    key_bytes = key.encode("utf-8")
+    if not payload.endswith(key_bytes):
+        return None
+    return payload[:len(payload) - len(key_bytes)].decode("utf-8", errors="replace")
+
+def hide_message_in_png(image_filename, message_to_hide, key, encoded_image, bits_per_channel=1,
+                        tile_budget=TILE_BUDGET, compression=None, compression_level=None, scatter=False,
+                        convert_palette=False, checksum=False):
     """
     The function `hide_message_in_png` takes an image file, a message to hide, a key, and an output file
     name, and encodes the message into the image using the LSB (Least Significant Bit) technique.
@@ -14,45 +796,26 @@ def hide_message_in_png(image_filename, message_to_hide, key, encoded_image):
     later used to extract the message from the encoded image
     :param encoded_image: The `encoded_image` parameter is the filename or path where the encoded image
     will be saved. It is the output file that will contain the original image with the hidden message
+    :param bits_per_channel: How many low bits of each channel value carry the message (1-4, or 1-8 for
+    16-bit images). It is recorded in the image, so decoding picks it up automatically
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param compression: None to store the message as it is, or "zlib", "bz2", "lzma" to compress it first;
+    "auto" uses zlib only when that makes the message smaller. Decoding decompresses automatically
+    :param compression_level: The compression level (0-9, 1-9 for bz2), or None for the codec default
+    :param scatter: Whether to spread the message over pseudo-random channel values chosen by `key`
+    instead of filling the image from the top
+    :param convert_palette: Whether to expand a palette (P) image to RGB(A) instead of rejecting it
+    :param checksum: Whether to record a CRC32 of the message, so `verify_png` can check it
     :return: a boolean value. It returns True if the message was successfully hidden in the image and
     saved as the encoded image file. It returns False if there was an error, such as the image file not
     being found or not enough space in the image to hide the message.
     """
     try:
-        image = Image.open(image_filename)
-        width, height = image.size
-        img_array = np.array(image)
-
-        if image.mode == "P":
-            raise ValueError("Indexed color mode (P) is not supported")
-
-        channels = img_array.shape[2]
-
-        pixels = img_array.size // channels
-
-        key_length = len(key)
-
-        message_to_hide += key
-
-        byte_message = ''.join(f"{ord(c):08b}" for c in message_to_hide)
-        message_length = len(byte_message)
-
-        if message_length > pixels:
-            raise ValueError("Not enough space in the image to hide the message")
-
-        img_array_flat = img_array.reshape(-1, channels)
-
-        index = 0
-        for i in range(pixels):
-            for j in range(channels):
-                if index < message_length:
-                    img_array_flat[i][j] = int(bin(img_array_flat[i][j])[2:-1] + byte_message[index], 2)
-                    index += 1
-
-        img_array = img_array_flat.reshape(height, width, channels)
-
-        result = Image.fromarray(img_array.astype('uint8'), image.mode)
-        result.save(encoded_image)
+        image = hide_message_in_image(_load_image(image_filename), message_to_hide, key, bits_per_channel,
+                                      tile_budget, compression, compression_level, scatter, convert_palette,
+                                      checksum)
+        with stage("save"):
+            image.save(encoded_image)
         return True
     except FileNotFoundError:
         print("Image file not found.")
@@ -61,7 +824,7 @@ def hide_message_in_png(image_filename, message_to_hide, key, encoded_image):
         print(str(e))
         return False
 
-def decode_message_from_png(image_filename, key):
+def decode_message_from_png(image_filename, key, tile_budget=TILE_BUDGET):
     """
     The function `decode_message_from_png` takes an image file and a key as input, decodes a hidden
     message from the image, and returns the message up to the occurrence of the key.
@@ -72,32 +835,26 @@ def decode_message_from_png(image_filename, key):
     represents the keyword or phrase that you are looking for in the decoded message. It is used to
     determine the portion of the decoded message that should be returned. If the `key` is found in the
     decoded message
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
     :return: The function `decode_message_from_png` returns either the decoded message (up to the
     occurrence of the key) or the string "Couldn't find the message."
+
+    Images carrying the payload header are decoded by reading only the stored payload and checking
+    that it ends with the key; older images are scanned for the key until it is found.
     """
     try:
-        image = Image.open(image_filename)
-        img_array = np.array(image)
-        channels = img_array.shape[2]
-        pixels = img_array.size // channels
-
-        img_array_flat = img_array.reshape(-1, channels)
-
-        bits = [bin(img_array_flat[i][j])[-1] for i in range(pixels) for j in range(channels)]
-        bits = [bits[i:i+8] for i in range(0, len(bits), 8)]
-
-        message = [chr(int(''.join(bits[i]), 2)) for i in range(len(bits))]
-        message = ''.join(message)
-
-        if key in message:
-            return message[:message.index(key)]
-        else:
-            return "Couldn't find the message."
+        message = decode_message_from_image(image_filename, key, tile_budget)
+        return "Couldn't find the message." if message is None else message
     except FileNotFoundError:
         print("Image file not found.")
         return None
+    except ValueError as e:
+        print(str(e))
+        return None
 
-def hide_file_in_png(image_filename, file_to_hide, key, encoded_image):
+def hide_file_in_png(image_filename, file_to_hide, key, encoded_image, bits_per_channel=1,
+                     tile_budget=TILE_BUDGET, compression=None, compression_level=None, scatter=False,
+                     convert_palette=False, checksum=False):
     """
     The function `hide_file_in_png` takes an image file, a file to hide, a key, and an encoded image
     file as input, and hides the file within the image using steganography techniques.
@@ -110,45 +867,26 @@ def hide_file_in_png(image_filename, file_to_hide, key, encoded_image):
     file
     :param encoded_image: The `encoded_image` parameter is the filename of the resulting image file that
     will contain the hidden file
+    :param bits_per_channel: How many low bits of each channel value carry the file (1-4, or 1-8 for
+    16-bit images). It is recorded in the image, so decoding picks it up automatically
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param compression: None to store the file as it is, or "zlib", "bz2", "lzma" to compress it first;
+    "auto" uses zlib only when that makes the file smaller. Decoding decompresses automatically
+    :param compression_level: The compression level (0-9, 1-9 for bz2), or None for the codec default
+    :param scatter: Whether to spread the file over pseudo-random channel values chosen by `key` instead
+    of filling the image from the top; `decode_file_from_png` then needs the key
+    :param convert_palette: Whether to expand a palette (P) image to RGB(A) instead of rejecting it
+    :param checksum: Whether to record a CRC32 of the file, so `verify_png` can check it
     :return: a boolean value. It returns True if the file hiding process is successful, and False if
     there is an error or exception occurs during the process.
     """
     try:
-        image = Image.open(image_filename)
-        width, height = image.size
-        img_array = np.array(image)
-
-        if image.mode == "P":
-            raise ValueError("Indexed color mode (P) is not supported")
-
-        channels = img_array.shape[2]
-
-        pixels = img_array.size // channels
-
-        key_length = len(key)
-
         with open(file_to_hide, 'rb') as file:
-            file_data = file.read()
-
-        byte_message = ''.join(f"{byte:08b}" for byte in file_data)
-        message_length = len(byte_message)
-
-        if message_length > pixels:
-            raise ValueError("Not enough space in the image to hide the file")
+            file_data, compression = _compress(file, compression, compression_level)
 
-        img_array_flat = img_array.reshape(-1, channels)
-
-        index = 0
-        for i in range(pixels):
-            for j in range(channels):
-                if index < message_length:
-                    img_array_flat[i][j] = int(bin(img_array_flat[i][j])[2:-1] + byte_message[index], 2)
-                    index += 1
-
-        img_array = img_array_flat.reshape(height, width, channels)
-
-        result = Image.fromarray(img_array.astype('uint8'), image.mode)
-        result.save(encoded_image)
+        _hide_payload(image_filename, file_data, encoded_image, bits_per_channel, "file",
+                      tile_budget=tile_budget, compression=compression, scatter_key=key if scatter else None,
+                      convert_palette=convert_palette, checksum=checksum)
         return True
     except FileNotFoundError:
         print("Image or file not found.")
@@ -157,7 +895,7 @@ def hide_file_in_png(image_filename, file_to_hide, key, encoded_image):
         print(str(e))
         return False
 
-def decode_file_from_png(image_filename, decoded_file):
+def decode_file_from_png(image_filename, decoded_file, tile_budget=TILE_BUDGET, key=None):
     """
     The function `decode_file_from_png` decodes a file from a PNG image and saves it as a separate file.
     
@@ -165,27 +903,483 @@ def decode_file_from_png(image_filename, decoded_file):
     you want to decode
     :param decoded_file: The `decoded_file` parameter is the name or path of the file where the decoded
     data will be saved
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :param key: The key the file was scattered with; not needed for files hidden without `scatter`
     :return: a string that indicates the status of the decoding process. If the decoding is successful
     and the file is saved, the function will return a string that says "File decoded and saved as
     [decoded_file]". If the image file is not found, the function will return None.
+
+    For images carrying the payload header only the stored payload is written; older images have their
+    whole LSB stream written out.
     """
     try:
-        image = Image.open(image_filename)
-        img_array = np.array(image)
-        channels = img_array.shape[2]
-        pixels = img_array.size // channels
+        _header, chunks = _payload_chunks(image_filename, tile_budget, key)
+        with open(decoded_file, 'wb') as file:
+            for chunk in chunks:
+                with stage("write", len(chunk)):
+                    file.write(chunk)
 
-        img_array_flat = img_array.reshape(-1, channels)
+        return f'File decoded and saved as {decoded_file}'
+    except FileNotFoundError:
+        print("Image file not found.")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
 
-        bits = [bin(img_array_flat[i][j])[-1] for i in range(pixels) for j in range(channels)]
-        bits = [bits[i:i+8] for i in range(0, len(bits), 8)]
+def image_capacity(image_filename):
+    """
+    The function `image_capacity` reports how many payload bytes an image can hold in each
+    bits-per-channel mode. Only the image header is read; the pixel data is not decoded.
+
+    :param image_filename: The name or path of the image to inspect
+    :return: a dict mapping each bits-per-channel value (1-4, or 1-8 for 16-bit images) to the number of
+    bytes that can be hidden, or None if the image file is not found.
+    """
+    try:
+        slots, depth = _carrier_layout(image_filename)
+        return {bits: _capacity_bytes(slots, bits) for bits in range(1, _max_bits_per_channel(depth) + 1)}
+    except FileNotFoundError:
+        print("Image file not found.")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
 
-        file_data = bytes([int(''.join(bits), 2) for bits in bits])
+def verify_image(image, key=None, tile_budget=TILE_BUDGET):
+    """
+    The function `verify_image` checks the payload of an image hidden with `checksum` enabled against
+    the CRC32 recorded in its header. Only the rows that hold the payload are decoded, and the payload
+    bits are streamed through the checksum without being decompressed or kept.
 
-        with open(decoded_file, 'wb') as file:
-            file.write(file_data)
+    :param image: The encoded image, in any of the forms accepted by `hide_bytes_in_image`
+    :param key: The key of a scattered payload; not needed otherwise
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :return: True if the payload matches its checksum and False if it does not. Raises ValueError if the
+    image carries no checksum or its header is corrupt, and FileNotFoundError for a missing path.
+    """
+    header, chunks = _stored_chunks(image, tile_budget, key)
+    if header is None or header.checksum is None:
+        raise ValueError("The image carries no payload checksum")
+    checksum = 0
+    for chunk in chunks:
+        with stage("checksum", len(chunk)):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum == header.checksum
+
+def verify_png(image_filename, key=None, tile_budget=TILE_BUDGET):
+    """
+    The function `verify_png` checks that an image written with `checksum` enabled still carries an
+    intact payload, without writing the payload out; see `verify_image`.
+
+    :param image_filename: The name or path of the encoded image
+    :param key: The key of a scattered payload; not needed otherwise
+    :param tile_budget: The working memory in bytes for the bands of rows processed at a time
+    :return: True if the payload is intact, False if it does not match its checksum, or None if the
+    image is not found, has no checksum or has a corrupt header.
+    """
+    try:
+        return verify_image(image_filename, key, tile_budget)
+    except FileNotFoundError:
+        print("Image file not found.")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
+
+def _describe_header(header):
+    """Return the fields of the payload ``header`` as a JSON-friendly dict."""
+    codecs = {codec_id: name for name, codec_id in payload_compression.CODECS.items()}
+    description = {"format_version": FORMAT_VERSION, "bits_per_channel": header.bits_per_channel,
+                   "stored_bytes": header.length, "header_bytes": header.data_offset // 8,
+                   "scattered": bool(header.flags & FLAG_SCATTERED), "compression": None, "shard": None,
+                   "checksum": None if header.checksum is None else f"crc32:{header.checksum:08x}",
+                   "frames": header.frames}
+    if header.compression is not None:
+        description["compression"] = {"codec": codecs[header.compression.codec],
+                                       "uncompressed_bytes": header.compression.length}
+    if header.shard is not None:
+        description["shard"] = {"payload_id": header.shard.payload_id.hex(), "index": header.shard.index,
+                                "count": header.shard.count, "offset": header.shard.offset}
+    return description
+
+def inspect_image(image_filename):
+    """
+    The function `inspect_image` describes an image and the payload it carries from the image header and
+    the rows holding the payload header only; the rest of the pixel data is not decoded.
+
+    :param image_filename: The name or path of the image to inspect
+    :return: a dict with the image format, mode, size and channel depth, the capacity in bytes for
+    each bits-per-channel mode, and the payload header fields ("payload" is None for images without a
+    header, including those written by older versions), or None if the image is not found or has a
+    corrupt header.
+    """
+    try:
+        image, header, _decoded = _load_header(image_filename)
+        slots, depth = image.width * image.height * len(image.getbands()), _channel_depth(image)
+        return {
+            "image_format": image.format,
+            "mode": image.mode,
+            "width": image.width,
+            "height": image.height,
+            "channel_bits": depth,
+            "capacity": {bits: _capacity_bytes(slots, bits) for bits in range(1, _max_bits_per_channel(depth) + 1)},
+            "payload": None if header is None else _describe_header(header),
+        }
+    except FileNotFoundError:
+        print("Image file not found.")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
 
+def enable_cover_cache(max_bytes=256 << 20):
+    """
+    The function `enable_cover_cache` keeps decoded cover images in memory so that hiding many payloads
+    in the same covers decodes each cover once. Covers given by path are re-decoded when the file's size
+    or modification time changes; covers given as bytes are matched by content.
+
+    :param max_bytes: The memory budget for the cached pixels; least recently used covers are evicted
+    beyond it. Calling the function again replaces the cache
+    :return: nothing.
+    """
+    global _cover_cache
+    _cover_cache = CoverCache(max_bytes)
+
+def disable_cover_cache():
+    """
+    The function `disable_cover_cache` drops the cover cache and its memory.
+
+    :return: nothing.
+    """
+    global _cover_cache
+    _cover_cache = None
+
+def cover_cache_stats():
+    """
+    The function `cover_cache_stats` reports how well the cover cache is working, to help size it.
+
+    :return: a dict with the hits, misses, evictions, entries, bytes and max_bytes of the cache, or None
+    if the cache is not enabled.
+    """
+    return None if _cover_cache is None else _cover_cache.stats()
+
+def _plan_shards(image_filenames, payload_length, bits_per_channel):
+    """Return ``(image_filename, offset, length)`` for the carriers needed to hold the payload, in order."""
+    plan = []
+    offset = 0
+    for image_filename in image_filenames:
+        slots, depth = _carrier_layout(image_filename)
+        _check_bits_per_channel(bits_per_channel, depth)
+        room = _capacity_bytes(slots, bits_per_channel, FLAG_SHARDED)
+        if room == 0:
+            continue
+        length = min(room, payload_length - offset)
+        plan.append((image_filename, offset, length))
+        offset += length
+        if offset >= payload_length:
+            return plan
+    raise ValueError("Not enough space in the images to hide the file")
+
+def _hide_shard(image_filename, file_to_hide, shard, length, bits_per_channel, encoded_image):
+    """Hide ``length`` bytes of ``file_to_hide`` starting at ``shard.offset``; runs in a worker process."""
+    with open(file_to_hide, 'rb') as file:
+        file.seek(shard.offset)
+        payload = file.read(length)
+    _hide_payload(image_filename, payload, encoded_image, bits_per_channel, "file", shard)
+    return encoded_image
+
+def _extract_shard(image_filename):
+    """Return the ``Shard`` record and payload bytes of a shard image; runs in a worker process."""
+    image, header = _open_payload(image_filename)
+    if header is None or header.shard is None:
+        raise ValueError(f"{image_filename} does not contain a shard")
+    return header.shard, b''.join(_iter_payload(image, header, TILE_BUDGET))
+
+def hide_file_in_pngs(image_filenames, file_to_hide, output_dir, bits_per_channel=1, workers=None):
+    """
+    The function `hide_file_in_pngs` splits a file that is too large for one image across an ordered
+    list of cover images. Carriers are filled in order and only as many as needed are used; the shards
+    are embedded concurrently in worker processes.
+
+    :param image_filenames: The cover images, in the order they should be filled
+    :param file_to_hide: The name or path of the file to hide
+    :param output_dir: The directory where the shard images are written, named after the hidden file
+    followed by the shard number
+    :param bits_per_channel: How many low bits of each channel value carry the file (1-4, or 1-8 for
+    16-bit images)
+    :param workers: The number of worker processes (default: the number of CPUs)
+    :return: the list of written shard images in shard order, or False if there was an error such as a
+    missing file or not enough space in the images.
+    """
+    try:
+        plan = _plan_shards(image_filenames, os.path.getsize(file_to_hide), bits_per_channel)
+        payload_id = uuid.uuid4().bytes
+        name = os.path.basename(file_to_hide)
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                instrumentation.submit(pool, _hide_shard, image_filename, file_to_hide,
+                                       Shard(payload_id, index, len(plan), offset), length, bits_per_channel,
+                                       os.path.join(output_dir, f"{name}.{index:03d}.png"))
+                for index, (image_filename, offset, length) in enumerate(plan)
+            ]
+            return [instrumentation.result(future) for future in futures]
+    except FileNotFoundError:
+        print("Image or file not found.")
+        return False
+    except ValueError as e:
+        print(str(e))
+        return False
+
+def decode_file_from_pngs(image_filenames, decoded_file, workers=None):
+    """
+    The function `decode_file_from_pngs` reassembles a file written by `hide_file_in_pngs`. The shard
+    images may be given in any order; they are decoded in worker processes and each shard is written
+    to its place in the output file as soon as it arrives.
+
+    :param image_filenames: The shard images, in any order
+    :param decoded_file: The name or path of the file where the reassembled data will be saved
+    :param workers: The number of worker processes (default: the number of CPUs)
+    :return: a string saying where the file was saved, or None if an image is missing, is not a shard,
+    belongs to a different payload or if shards are missing.
+    """
+    partial = decoded_file + ".part"
+    try:
+        if not image_filenames:
+            raise ValueError("No shard images given")
+        seen = set()
+        first = None
+        with ProcessPoolExecutor(workers) as pool, open(partial, 'wb') as file:
+            futures = [instrumentation.submit(pool, _extract_shard, image_filename) for image_filename in image_filenames]
+            for future in as_completed(futures):
+                shard, data = instrumentation.result(future)
+                first = first or shard
+                if (shard.payload_id, shard.count) != (first.payload_id, first.count):
+                    raise ValueError("The images belong to different hidden files")
+                if shard.index in seen:
+                    raise ValueError(f"Shard {shard.index} was given more than once")
+                seen.add(shard.index)
+                file.seek(shard.offset)
+                file.write(data)
+        if len(seen) != first.count:
+            raise ValueError(f"Missing shards: found {len(seen)} of {first.count}")
+        os.replace(partial, decoded_file)
         return f'File decoded and saved as {decoded_file}'
     except FileNotFoundError:
         print("Image file not found.")
-        return None
\ No newline at end of file
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+def _frame_sources(frames):
+    """Return ``frames``, one animated image or a sequence of image files, as a list of sources."""
+    return [frames] if isinstance(frames, (str, os.PathLike)) else list(frames)
+
+def _frame_layout(sources):
+    """Return ``(slots, depth)`` for every frame of the images ``sources``, reading only their headers."""
+    layout = []
+    for source in sources:
+        with Image.open(source) as image:
+            _check_mode(image)
+            slots = image.width * image.height * len(image.getbands())
+            layout += [(slots, _channel_depth(image))] * getattr(image, "n_frames", 1)
+    if len(sources) > 1 and len(layout) > len(sources):
+        raise ValueError("Animated images cannot be part of an image sequence")
+    return layout
+
+def _iter_frames(sources):
+    """Yield the frames of the images ``sources`` in order, decoding one frame at a time.
+
+    The frames of an animated image are yielded as the same ``Image`` object after seeking, so each
+    frame must be used before the next one is requested.
+    """
+    for source in sources:
+        with Image.open(source) as image:
+            for index in range(getattr(image, "n_frames", 1)):
+                with stage("load"):
+                    image.seek(index)
+                    image.load()
+                yield image
+
+def _plan_frames(layout, payload_length, bits_per_channel):
+    """Return how many of the frames ``layout`` hold the header and ``payload_length`` bytes.
+
+    Raises ``ValueError`` if the frames are too small or do not support ``bits_per_channel``.
+    """
+    header_bits = _header_size(FLAG_FRAMES) * 8
+    if not layout or layout[0][0] < header_bits:
+        raise ValueError("The first frame is too small to hold the payload header")
+    needed = header_bits + -(-payload_length * 8 // bits_per_channel)
+    total = 0
+    for count, (slots, depth) in enumerate(layout, 1):
+        _check_bits_per_channel(bits_per_channel, depth)
+        total += slots
+        if total >= needed:
+            return count
+    raise ValueError("Not enough space in the frames to hide the file")
+
+def _sequence_names(sources):
+    """Return the PNG file name each frame of the sequence ``sources`` is written to.
+
+    Raises ``ValueError`` if two frames would be written to the same file, e.g. ``a/001.png`` and
+    ``b/001.png`` or ``001.png`` and ``001.jpg``.
+    """
+    names = [os.path.splitext(os.path.basename(source))[0] + ".png" for source in sources]
+    seen = set()
+    for source, name in zip(sources, names):
+        if os.path.normcase(name) in seen:
+            raise ValueError(f"More than one frame would be written to {name} (the last is {source})")
+        seen.add(os.path.normcase(name))
+    return names
+
+def _embed_frame(flat, base, header, file, payload_length, bits_per_channel):
+    """Write the part of the header and of the payload in ``file`` that falls in the frame ``flat``.
+
+    ``flat`` holds the channel values from ``base`` onwards of the slot stream running through all the
+    frames. Only the payload bytes stored in this frame are read from ``file``.
+    """
+    data_offset = len(header) * 8
+    _write_region(flat, base, header, 0)
+    first = max(base, data_offset)
+    last = min(base + flat.size, data_offset + -(-payload_length * 8 // bits_per_channel))
+    if first >= last:
+        return
+    # Read whole groups of ``bits_per_channel`` bytes, so the slice starts and ends on channel values.
+    group_bits = 8 * bits_per_channel
+    start = (first - data_offset) * bits_per_channel // group_bits * bits_per_channel
+    stop = min(payload_length, -(-(last - data_offset) * bits_per_channel // group_bits) * bits_per_channel)
+    with stage("read", stop - start):
+        file.seek(start)
+        data = file.read(stop - start)
+    with stage("embed", len(data)):
+        _write_region(flat, base, data, data_offset + start * 8 // bits_per_channel, bits_per_channel)
+
+def _iter_frames_payload(sources, chunk_slots=1 << 22):
+    """Yield the payload spread over the frames of ``sources`` frame by frame; raises ``ValueError``."""
+    header = None
+    base = frames = 0
+    pending = np.zeros(0, dtype=np.uint8)
+    for frame in _iter_frames(sources):
+        with stage("to-array", frame.width * frame.height * len(frame.getbands())):
+            flat = _channels(np.asarray(frame))
+        if header is None:
+            header = _read_header(flat[:MAX_HEADER_BITS], flat.size)
+            if header is None or not header.flags & FLAG_FRAMES:
+                raise ValueError("The images do not hold a payload spread over frames")
+        for start in range(0, flat.size, chunk_slots):
+            with stage("extract", min(chunk_slots, flat.size - start)):
+                bits = _read_region(flat[start:start + chunk_slots], base + start, header.data_offset,
+                                    header.length * 8, header.bits_per_channel)
+                pending = np.concatenate((pending, bits))
+            whole = pending.size - pending.size % 8
+            if whole:
+                yield np.packbits(pending[:whole]).tobytes()
+                pending = pending[whole:]
+        base += flat.size
+        frames += 1
+        if frames == header.frames:
+            return
+    if header is None:
+        raise ValueError("No frames given")
+    raise ValueError(f"Missing frames: found {frames} of {header.frames}")
+
+def hide_file_in_frames(frames, file_to_hide, output, bits_per_channel=1):
+    """
+    The function `hide_file_in_frames` spreads a file over the frames of an animated PNG or of a
+    sequence of images. Frames are decoded, filled with the next part of the file and written out one
+    at a time, and only the part of the file stored in the current frame is read, so memory stays
+    bounded by a couple of frames however long the animation and the file are.
+
+    :param frames: The path of an animated image, or the images of a sequence in order
+    :param file_to_hide: The name or path of the file to hide
+    :param output: For an animated image, the path of the animated PNG to write; for a sequence, the
+    directory the frames are written to as PNG files named after the input frames, which must not
+    share a name once their directory and extension are dropped
+    :param bits_per_channel: How many low bits of each channel value carry the file (1-4, or 1-8 for
+    16-bit images)
+    :return: the list of written images (the animated PNG, or every frame of the sequence), or False if
+    there was an error such as a missing file or not enough space in the frames.
+    """
+    partial = None
+    try:
+        sources = _frame_sources(frames)
+        layout = _frame_layout(sources)
+        length = os.path.getsize(file_to_hide)
+        count = _plan_frames(layout, length, bits_per_channel)
+        header = _pack_header(length, FLAG_FRAMES, bits_per_channel, frames=count)
+        writer = names = None
+        if len(sources) == 1 and len(layout) > 1:
+            partial = output + ".part"
+            with Image.open(sources[0]) as image:
+                loop = image.info.get("loop", 0)
+        else:
+            names = _sequence_names(sources)
+            os.makedirs(output, exist_ok=True)
+        written = []
+        animation_file = open(partial, 'wb') if partial is not None else contextlib.nullcontext()
+        with open(file_to_hide, 'rb') as file, animation_file as animation:
+            if partial is not None:
+                writer = APNGWriter(animation, len(layout), loop)
+            base = 0
+            for index, frame in enumerate(_iter_frames(sources)):
+                if frame.width * frame.height * len(frame.getbands()) != layout[index][0]:
+                    raise ValueError(f"Frame {index} does not match the size and mode of the first frame")
+                with stage("to-array", layout[index][0]):
+                    pixels = np.array(frame)
+                flat = pixels.reshape(-1)
+                _embed_frame(flat, base, header, file, length, bits_per_channel)
+                base += flat.size
+                encoded = Image.frombuffer(frame.mode, frame.size, pixels, "raw", frame.mode, 0, 1)
+                with stage("save"):
+                    if writer is not None:
+                        writer.add(encoded, frame.info.get("duration", 0))
+                    else:
+                        written.append(os.path.join(output, names[index]))
+                        encoded.save(written[-1])
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            os.replace(partial, output)
+            written.append(output)
+        return written
+    except FileNotFoundError:
+        print("Image or file not found.")
+        return False
+    except ValueError as e:
+        print(str(e))
+        return False
+    finally:
+        if partial is not None and os.path.exists(partial):
+            os.remove(partial)
+
+def decode_file_from_frames(frames, decoded_file):
+    """
+    The function `decode_file_from_frames` extracts a file written by `hide_file_in_frames`, decoding
+    one frame at a time and writing the part of the file it holds before moving to the next.
+
+    :param frames: The path of the animated PNG, or the images of the sequence in the same order
+    :param decoded_file: The name or path of the file where the decoded data will be saved
+    :return: a string saying where the file was saved, or None if an image is missing, does not hold
+    a payload spread over frames or if frames are missing.
+    """
+    partial = decoded_file + ".part"
+    try:
+        with open(partial, 'wb') as file:
+            for chunk in _iter_frames_payload(_frame_sources(frames)):
+                with stage("write", len(chunk)):
+                    file.write(chunk)
+        os.replace(partial, decoded_file)
+        return f'File decoded and saved as {decoded_file}'
+    except FileNotFoundError:
+        print("Image file not found.")
+        return None
+    except ValueError as e:
+        print(str(e))
+        return None
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
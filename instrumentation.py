@@ -0,0 +1,193 @@
+"""Lightweight per-stage timing for the image and text codecs.
+
+The codecs wrap their stages (PNG load, array conversion, embedding, saving, ...) in ``stage()``.
+While nothing is listening, ``stage()`` returns a shared no-op context manager, so instrumentation
+costs one function call per stage. ``enable()`` keeps the records for ``summary()``, and
+``add_listener()`` forwards every record to a callback, e.g. to push metrics to a collector.
+"""
+
+import time
+import tracemalloc
+
+_enabled = False
+_trace_memory = False
+_listeners = []
+_records = []
+
+
+class _NullStage:
+    """Context manager used while instrumentation is off; setting ``nbytes`` on it is ignored."""
+
+    __slots__ = ()
+
+    nbytes = property(lambda self: 0, lambda self, value: None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Context manager timing one stage and publishing its record on exit."""
+
+    __slots__ = ("name", "nbytes", "_started", "_memory")
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        if _trace_memory:
+            self._memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._started
+        record = {"stage": self.name, "seconds": seconds, "bytes": self.nbytes}
+        if _trace_memory:
+            record["peak_bytes"] = tracemalloc.get_traced_memory()[1] - self._memory
+        if _enabled:
+            _records.append(record)
+        for listener in _listeners:
+            listener(record)
+        return False
+
+
+def stage(name, nbytes=0):
+    """Return a context manager recording the wall time of stage ``name`` that processes ``nbytes`` bytes.
+
+    When the size is only known inside the stage, set ``nbytes`` on the object returned by ``with``.
+    """
+    if not (_enabled or _listeners):
+        return _NULL_STAGE
+    return _Stage(name, nbytes)
+
+
+def enable(trace_memory=False):
+    """Start keeping stage records; with ``trace_memory`` also record peak Python/NumPy allocations."""
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stop keeping stage records and tracing memory; listeners stay registered."""
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory:
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def reset():
+    """Forget the records kept so far."""
+    _records.clear()
+
+
+def records():
+    """Return a copy of the stage records kept since the last ``reset()``."""
+    return list(_records)
+
+
+class _Recorded:
+    """Result of a call made by ``submit()`` in a worker process, with the records it produced there."""
+
+    __slots__ = ("value", "records")
+
+    def __init__(self, value, records):
+        self.value = value
+        self.records = records
+
+
+def _call_recorded(trace_memory, function, args):
+    """Call ``function(*args)`` with recording enabled and return a ``_Recorded``; runs in a worker process.
+
+    Listeners a forked worker inherited from its parent are not called; the parent's ``result()``
+    passes the records to the real ones.
+    """
+    inherited = _listeners[:]
+    _listeners.clear()
+    enable(trace_memory)
+    reset()
+    try:
+        value = function(*args)
+        return _Recorded(value, records())
+    finally:
+        disable()
+        reset()
+        _listeners.extend(inherited)
+
+
+def submit(pool, function, *args):
+    """Submit ``function(*args)`` to the process ``pool``; read its outcome with ``result()``.
+
+    Stages run in worker processes are not seen by this process on their own. While recording is
+    enabled or listeners are registered, the worker records its stages too and sends them back along
+    with the result, and ``result()`` keeps them and passes them to the listeners as if they had run
+    here.
+    """
+    if not (_enabled or _listeners):
+        return pool.submit(function, *args)
+    return pool.submit(_call_recorded, _trace_memory, function, args)
+
+
+def result(future):
+    """Return the result of a ``future`` from ``submit()``, keeping the stage records the worker sent back."""
+    value = future.result()
+    if isinstance(value, _Recorded):
+        for record in value.records:
+            if _enabled:
+                _records.append(record)
+            for listener in _listeners:
+                listener(record)
+        value = value.value
+    return value
+
+
+def add_listener(listener):
+    """Call ``listener(record)`` for every finished stage, whether or not recording is enabled."""
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Stop calling ``listener``."""
+    _listeners.remove(listener)
+
+
+def summary():
+    """Return the kept records aggregated per stage, in the order the stages first ran.
+
+    Each entry has the stage name, the number of calls, the total seconds and bytes and, when memory
+    tracing is on, the largest peak allocation of a single call.
+    """
+    stages = {}
+    for record in _records:
+        entry = stages.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "seconds": 0.0, "bytes": 0})
+        entry["calls"] += 1
+        entry["seconds"] += record["seconds"]
+        entry["bytes"] += record["bytes"]
+        if "peak_bytes" in record:
+            entry["peak_bytes"] = max(entry.get("peak_bytes", 0), record["peak_bytes"])
+    return list(stages.values())
+
+
+def format_summary(entries):
+    """Return ``entries`` from ``summary()`` as a human-readable table."""
+    total = sum(entry["seconds"] for entry in entries) or 1.0
+    lines = [f"{'stage':<16}{'calls':>7}{'seconds':>11}{'share':>8}{'MB':>10}{'MB/s':>10}{'peak MB':>10}"]
+    for entry in entries:
+        megabytes = entry["bytes"] / 1e6
+        rate = f"{megabytes / entry['seconds']:.1f}" if entry["bytes"] and entry["seconds"] else ""
+        peak = f"{entry['peak_bytes'] / 1e6:.1f}" if "peak_bytes" in entry else ""
+        lines.append(f"{entry['stage']:<16}{entry['calls']:>7}{entry['seconds']:>11.4f}"
+                     f"{entry['seconds'] / total:>8.0%}{megabytes:>10.3f}{rate:>10}{peak:>10}")
+    return "\n".join(lines)
@@ -1,7 +1,7 @@
-import image_encryptor
-import text_encryptor
 import os
 
+from operations import load
+
 def hide_message_in_png_menu():
     """
     The function `hide_message_in_png_menu` prompts the user to enter an image filename, a message to
@@ -17,7 +17,7 @@ def hide_message_in_png_menu():
         message_to_hide = input("Enter the message to hide: ")
         key = input("Enter the key: ")
         encoded_image = input("Enter the encoded image filename: ")
-        success = image_encryptor.hide_message_in_png(image_filename, message_to_hide, key, encoded_image)
+        success = load("hide-message")(image_filename, message_to_hide, key, encoded_image)
         if success:
             print("Message hidden successfully.")
     except Exception as e:
@@ -35,7 +35,7 @@ def decode_message_from_png_menu():
             print("File not found.")
             return
         key = input("Enter the key: ")
-        decoded_message = image_encryptor.decode_message_from_png(encoded_image, key)
+        decoded_message = load("decode-message")(encoded_image, key)
         print("Decoded message:", decoded_message)
     except Exception as e:
         print("An error occurred:", str(e))
@@ -58,7 +58,7 @@ def hide_file_in_png_menu():
             return
         key = input("Enter the key: ")
         encoded_image = input("Enter the encoded image filename: ")
-        success = image_encryptor.hide_file_in_png(image_filename, hidden_file, key, encoded_image)
+        success = load("hide-file")(image_filename, hidden_file, key, encoded_image)
         if success:
             print("File hidden successfully.")
     except Exception as e:
@@ -76,7 +76,7 @@ def decode_file_from_png_menu():
             print("File not found.")
             return
         decoded_file = input("Enter the decoded file filename: ")
-        success = image_encryptor.decode_file_from_png(encoded_image, decoded_file)
+        success = load("decode-file")(encoded_image, decoded_file)
         if success:
             print(f"File decoded and saved as {decoded_file}")
     except Exception as e:
@@ -96,7 +96,7 @@ def encrypt_text_file_menu():
             return
         encrypted_output_file = input("Enter the encrypted output file filename: ")
         key = input("Enter the encryption key: ")
-        success = text_encryptor.encrypt_text_file(input_file, key, encrypted_output_file)
+        success = load("encrypt-file")(input_file, key, encrypted_output_file)
         if success:
             print(f"Text file {input_file} encrypted and saved as {encrypted_output_file}")
     except Exception as e:
@@ -116,7 +116,7 @@ def decrypt_text_file_menu():
             return
         decrypted_output_file = input("Enter the decrypted output file filename: ")
         key = input("Enter the decryption key: ")
-        success = text_encryptor.decrypt_text_file(encrypted_file, key, decrypted_output_file)
+        success = load("decrypt-file")(encrypted_file, key, decrypted_output_file)
         if success:
             print(f"Text file {encrypted_file} decrypted and saved as {decrypted_output_file}")
     except Exception as e:
@@ -131,7 +131,7 @@ def encrypt_text_menu():
     try:
         plaintext = input("Enter the text to encrypt: ")
         key = input("Enter the encryption key: ")
-        encrypted_text = text_encryptor.encrypt_text(plaintext, key)
+        encrypted_text = load("encrypt-text")(plaintext, key)
         print("Encrypted text:", encrypted_text)
     except Exception as e:
         print("An error occurred:", str(e))
@@ -144,7 +144,7 @@ def decrypt_text_menu():
     try:
         ciphertext = input("Enter the text to decrypt: ")
         key = input("Enter the decryption key: ")
-        decrypted_text = text_encryptor.decrypt_text(ciphertext, key)
+        decrypted_text = load("decrypt-text")(ciphertext, key)
         print("Decrypted text:", decrypted_text)
     except Exception as e:
         print("An error occurred:", str(e))
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""Registry of the operations offered by ``cli.py`` and ``menus.py``.
+
+Each operation names the module and function that implement it, and the module is imported the first
+time the operation runs. The text commands therefore never load NumPy and Pillow, which cost far more
+than encrypting a short string.
+"""
+
+import importlib
+from collections import namedtuple
+
+Operation = namedtuple("Operation", ["name", "module", "function"])
+
+OPERATIONS = {}
+
+
+def register(name, module, function):
+    """Register ``module.function`` as the implementation of operation ``name``."""
+    OPERATIONS[name] = Operation(name, module, function)
+
+
+def load(name):
+    """Return the function implementing operation ``name``, importing its module on first use.
+
+    Raises ``KeyError`` for an unknown operation.
+    """
+    operation = OPERATIONS[name]
+    return getattr(importlib.import_module(operation.module), operation.function)
+
+
+def modules():
+    """Return the names of the modules that implement the registered operations."""
+    return sorted({operation.module for operation in OPERATIONS.values()})
+
+
+register("hide-message", "image_encryptor", "hide_message_in_png")
+register("decode-message", "image_encryptor", "decode_message_from_png")
+register("hide-file", "image_encryptor", "hide_file_in_png")
+register("decode-file", "image_encryptor", "decode_file_from_png")
+register("hide-file-sharded", "image_encryptor", "hide_file_in_pngs")
+register("decode-file-sharded", "image_encryptor", "decode_file_from_pngs")
+register("hide-file-frames", "image_encryptor", "hide_file_in_frames")
+register("decode-file-frames", "image_encryptor", "decode_file_from_frames")
+register("capacity", "image_encryptor", "image_capacity")
+register("verify", "image_encryptor", "verify_png")
+register("inspect", "image_encryptor", "inspect_image")
+register("batch", "batch", "run_batch")
+register("load-manifest", "batch", "load_manifest")
+register("hide-jobs", "batch", "hide_jobs_from_directories")
+register("decode-jobs", "batch", "decode_jobs_from_directory")
+register("encrypt-text", "text_encryptor", "encrypt_text")
+register("decrypt-text", "text_encryptor", "decrypt_text")
+register("encrypt-file", "text_encryptor", "encrypt_text_file")
+register("decrypt-file", "text_encryptor", "decrypt_text_file")
+register("encrypt-tree", "text_tree", "encrypt_tree")
+register("decrypt-tree", "text_tree", "decrypt_tree")
+register("serve", "daemon", "serve")
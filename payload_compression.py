@@ -0,0 +1,148 @@
+"""Optional compression of hidden payloads.
+
+Payloads are compressed chunk by chunk before they are embedded, and the codec and the original length
+are recorded in the payload header so decoding decompresses without being told. ``"auto"`` compresses
+with zlib but keeps the payload as it is when that does not make it smaller; data whose first chunk
+does not compress (images, archives, encrypted files) is not compressed at all, and the rest of the
+input is abandoned as soon as the compressed output catches up with it.
+"""
+
+import zlib
+
+from instrumentation import stage
+
+# Codec names and the ids stored in the payload header.
+CODECS = {"zlib": 1, "bz2": 2, "lzma": 3}
+AUTO = "auto"
+CHUNK_SIZE = 1 << 20
+
+# "auto" gives up when zlib cannot bring the first chunk below this fraction of its size.
+_PROBE_RATIO = 0.97
+
+
+def _compressor(codec, level):
+    """Return a streaming compressor for ``codec`` at ``level`` (the codec's default when ``None``)."""
+    if level is not None and not (1 if codec == "bz2" else 0) <= level <= 9:
+        raise ValueError(f"Invalid compression level {level} for {codec}")
+    if codec == "zlib":
+        return zlib.compressobj(-1 if level is None else level)
+    if codec == "bz2":
+        import bz2
+        return bz2.BZ2Compressor(9 if level is None else level)
+    import lzma
+    return lzma.LZMACompressor(preset=level)
+
+
+def _decompressor(codec_id):
+    if codec_id == CODECS["zlib"]:
+        return zlib.decompressobj()
+    if codec_id == CODECS["bz2"]:
+        import bz2
+        return bz2.BZ2Decompressor()
+    if codec_id == CODECS["lzma"]:
+        import lzma
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unsupported compression codec {codec_id}")
+
+
+def _chunks(source):
+    """Yield ``source`` (bytes-like or a binary file object) in ``CHUNK_SIZE`` pieces; bytes-like data is not copied."""
+    if hasattr(source, "read"):
+        while True:
+            with stage("read") as timer:
+                chunk = source.read(CHUNK_SIZE)
+                timer.nbytes = len(chunk)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        view = memoryview(source).cast("B")
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+
+
+def compress(source, codec, level=None):
+    """Return ``(data, codec_id, length)`` for ``source`` (bytes-like or a binary file object) compressed with ``codec``.
+
+    ``codec`` is one of ``CODECS`` or ``"auto"`` and ``length`` is the uncompressed size. ``data`` is
+    a ``bytearray`` when compressed. ``codec_id`` is ``None`` when ``"auto"`` decided against
+    compressing, and ``data`` is then the payload itself.
+    ``"auto"`` gives up as soon as the compressed output stops being smaller than the input read so
+    far, and only holds the compressed data: a seekable file is read again from where it started
+    when the payload is stored as it is. Raises ``ValueError`` for an unknown codec or level.
+    """
+    name = "zlib" if codec == AUTO else codec
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression {codec!r}; choose from {sorted(CODECS) + [AUTO]}")
+    compressor = _compressor(name, level)
+    auto = codec == AUTO
+    start = _start_position(source) if auto else None
+    # Only a file that cannot be read again has to keep what was read, in case "auto" falls back.
+    raw = [] if auto and start is None and hasattr(source, "read") else None
+    compressed, length = bytearray(), 0
+    for chunk in _chunks(source):
+        length += len(chunk)
+        if raw is not None:
+            raw.append(chunk)
+        if auto and length == len(chunk) and len(zlib.compress(chunk, 1)) > _PROBE_RATIO * len(chunk):
+            return _uncompressed(source, start, raw)
+        with stage("compress", len(chunk)):
+            compressed += compressor.compress(chunk)
+        if auto and len(compressed) >= length:
+            del compressed
+            return _uncompressed(source, start, raw)
+    compressed += compressor.flush()
+    if auto and len(compressed) >= length:
+        del compressed
+        return _uncompressed(source, start, raw)
+    return compressed, CODECS[name], length
+
+
+def _start_position(source):
+    """Return the position of a seekable file ``source``, or ``None`` if it cannot be read again."""
+    if not hasattr(source, "read"):
+        return None
+    try:
+        return source.tell() if source.seekable() else None
+    except (AttributeError, OSError):
+        return None
+
+
+def _uncompressed(source, start, raw):
+    """Return ``(data, None, length)`` for the whole payload of ``source``, stored as it is.
+
+    Bytes-like sources are reused as they are. A seekable file is read again from ``start``; any
+    other file is the ``raw`` chunks read so far followed by the rest of it.
+    """
+    if not hasattr(source, "read"):
+        return source, None, memoryview(source).nbytes
+    if raw is None:
+        source.seek(start)
+        with stage("read") as timer:
+            data = source.read()
+            timer.nbytes = len(data)
+    else:
+        data = b"".join([*raw, *_chunks(source)])
+    return data, None, len(data)
+
+
+def iter_decompress(chunks, codec_id, length):
+    """Yield the decompressed data of the compressed ``chunks``.
+
+    Raises ``ValueError`` if the data is corrupt or does not decompress to exactly ``length`` bytes.
+    """
+    decompressor = _decompressor(codec_id)
+    produced = 0
+    for chunk in chunks:
+        with stage("decompress", len(chunk)):
+            try:
+                data = decompressor.decompress(chunk)
+            except Exception as e:
+                raise ValueError("Corrupt compressed payload") from e
+        produced += len(data)
+        if produced > length:
+            raise ValueError("Corrupt compressed payload")
+        if data:
+            yield data
+    if produced != length or not decompressor.eof:
+        raise ValueError("Corrupt compressed payload")
@@ -0,0 +1,56 @@
+"""Keyed pseudo-random permutation of channel slots for scattered embedding.
+
+Scattered payloads are spread over the whole image instead of filling it from the top. Payload slot
+``i`` is stored in channel slot ``permutation(i)``, where the permutation is a bijection of
+``[0, domain)`` derived from the key and a per-image salt. It is a balanced Feistel network over the
+smallest power-of-four range that covers the domain, and out-of-range results are fed through the
+network again until they land inside it (cycle walking). Only the positions that are asked for are
+computed, as NumPy vectors, so the cost depends on the payload and not on the image size.
+"""
+
+import hashlib
+
+import numpy as np
+
+ROUNDS = 4
+SALT_SIZE = 16
+
+_MULTIPLIER_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MULTIPLIER_2 = np.uint64(0x94D049BB133111EB)
+
+
+class KeyedPermutation:
+    """Bijection of ``[0, domain)`` selected by ``key`` and ``salt``."""
+
+    def __init__(self, key, salt, domain):
+        if domain < 1:
+            raise ValueError("The permutation domain must not be empty")
+        self.domain = domain
+        self.half_bits = max(1, -(-(domain - 1).bit_length() // 2))
+        self._half_mask = np.uint64((1 << self.half_bits) - 1)
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8 * ROUNDS, salt=salt).digest()
+        self._round_keys = np.frombuffer(digest, dtype=">u8").astype(np.uint64)
+
+    def _round(self, half, round_key):
+        """Return the round function of ``half``: a SplitMix64-style mix of ``half ^ round_key``, truncated."""
+        mixed = half ^ round_key
+        mixed = (mixed ^ (mixed >> np.uint64(30))) * _MULTIPLIER_1
+        mixed = (mixed ^ (mixed >> np.uint64(27))) * _MULTIPLIER_2
+        return (mixed ^ (mixed >> np.uint64(31))) & self._half_mask
+
+    def _feistel(self, values):
+        shift = np.uint64(self.half_bits)
+        left, right = values >> shift, values & self._half_mask
+        for round_key in self._round_keys:
+            left, right = right, left ^ self._round(right, round_key)
+        return (left << shift) | right
+
+    def positions(self, start, stop):
+        """Return ``permutation(i)`` for ``i`` in ``range(start, stop)`` as an int64 array."""
+        values = self._feistel(np.arange(start, stop, dtype=np.uint64))
+        outside = np.flatnonzero(values >= self.domain)
+        while outside.size:
+            walked = self._feistel(values[outside])
+            values[outside] = walked
+            outside = outside[walked >= self.domain]
+        return values.astype(np.int64)
@@ -0,0 +1,39 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import batch
+
+
+def test_batch_hide_and_decode_survive_failing_jobs(tmp_path: Path):
+    images = tmp_path / "images"
+    files = tmp_path / "files"
+    images.mkdir()
+    files.mkdir()
+    for index in range(3):
+        Image.fromarray(np.full((16, 16, 3), index * 40, dtype=np.uint8)).save(images / f"{index}.png")
+        (files / f"{index}.txt").write_bytes(b"payload %d" % index * (1 + 20 * (index == 2)))
+
+    hide_jobs = batch.hide_jobs_from_directories(str(images), str(files), str(tmp_path), {"key": "k"})
+    seen = []
+    summary = batch.run_batch("hide", hide_jobs, workers=2, on_result=seen.append, cover_cache_bytes=1 << 20)
+    assert (summary["jobs"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert len(seen) == 3
+    failed = [result for result in summary["results"] if result["status"] == "error"]
+    assert "Not enough space" in failed[0]["error"]
+    assert summary["cover_cache"]["misses"] == 3
+    json.dumps(summary)
+
+    manifest = tmp_path / "decode.jsonl"
+    manifest.write_text("\n".join(
+        json.dumps({"image": str(tmp_path / f"{index}.txt.png"), "output": str(tmp_path / f"{index}.out")})
+        for index in range(2)
+    ))
+    summary = batch.run_batch("decode", batch.load_manifest(str(manifest)), workers=2)
+    assert summary["succeeded"] == 2
+    assert (tmp_path / "1.out").read_bytes() == b"payload 1"
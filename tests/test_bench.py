@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+import bench
+
+
+def test_compare_flags_only_slowdowns_over_threshold():
+    baseline = {"a": {"seconds": 1.0}, "b": {"seconds": 1.0}, "c": {"seconds": 0.0001}}
+    current = {"a": {"seconds": 1.2}, "b": {"seconds": 1.5}, "c": {"seconds": 0.0009}, "new": {"seconds": 9.0}}
+    assert bench.compare(baseline, current, threshold=0.25) == [("b", 1.0, 1.5)]
+
+
+def test_benchmarks_run_on_small_inputs():
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    results = bench.bench_images(["small"], ["L"], ["1KB"], repeat=1, rng=rng)
+    assert set(results) == {"load/small/L", "hide/small/L/1KB", "save/small/L/1KB", "decode/small/L/1KB"}
+    assert results["hide/small/L/1KB"]["mb_s"] > 0
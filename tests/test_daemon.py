@@ -0,0 +1,56 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import daemon
+
+
+def test_daemon_runs_commands_on_warm_workers(tmp_path: Path):
+    address = str(tmp_path / "daemon.sock")
+    server = daemon.make_server(address, workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        (tmp_path / "plain.txt").write_text("Hello World")
+        response = daemon.request("encrypt-file", ["plain.txt", "Key", "cipher.txt"], address, cwd=str(tmp_path))
+        assert response["ok"], response
+        assert (tmp_path / "cipher.txt").read_text() == "Rijvs Gspvh"
+
+        response = daemon.forward("decrypt-text", ["Rijvs Gspvh", "Key"], address)
+        assert response == {"ok": True, "stdout": "Hello World\n", "stderr": ""}
+
+        response = daemon.request("decrypt-text", ["only-one-argument"], address)
+        assert not response["ok"] and "required" in response["error"]
+        assert not daemon.request("serve", [], address)["ok"]
+    finally:
+        server.shutdown()
+        daemon.close_server(server)
+    assert daemon.forward("encrypt-text", ["a", "b"], address) is None
+
+
+def test_tcp_daemon_requires_its_token(tmp_path: Path):
+    import os
+    import stat
+
+    server = daemon.make_server(("127.0.0.1", 0), workers=1)
+    address = server.server_address
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    token_file = Path(daemon.token_path(address))
+    try:
+        assert stat.S_IMODE(os.stat(token_file).st_mode) == 0o600
+        assert daemon.request("encrypt-text", ["Hello World", "Key"], address)["stdout"] == "Rijvs Gspvh\n"
+
+        (tmp_path / "secret.txt").write_text("Hello World")
+        for token in (None, "guess"):
+            response = daemon._exchange(daemon._connect(address), "encrypt-file",
+                                        ["secret.txt", "Key", "copy.txt"], str(tmp_path), token)
+            assert not response["ok"] and "token" in response["error"]
+        assert not (tmp_path / "copy.txt").exists()
+    finally:
+        server.shutdown()
+        daemon.close_server(server)
+    assert not token_file.exists()
+    assert daemon.forward("encrypt-text", ["a", "b"], address) is None
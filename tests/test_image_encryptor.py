@@ -0,0 +1,527 @@
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import image_encryptor
+
+
+def _make_image(path: Path, size=(32, 24), mode="RGB", seed=0) -> Path:
+    rng = np.random.default_rng(seed)
+    channels = len(mode)
+    data = rng.integers(0, 256, size=(size[1], size[0], channels), dtype=np.uint8)
+    Image.fromarray(data, mode).save(path)
+    return path
+
+
+def _legacy_embed(image_path: Path, bit_string: str) -> np.ndarray:
+    img_array = np.array(Image.open(image_path))
+    flat = img_array.reshape(-1)
+    for index, bit in enumerate(bit_string):
+        flat[index] = int(bin(flat[index])[2:-1] + bit, 2)
+    return img_array
+
+
+def _bit_string(data: bytes) -> str:
+    return ''.join(f"{b:08b}" for b in data)
+
+
+def _header(length: int) -> bytes:
+    return b"SENC" + bytes([1, 0, 1, 0]) + length.to_bytes(8, "big")
+
+
+def test_hide_message_matches_bitwise_reference(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png")
+    out = tmp_path / "out.png"
+    assert image_encryptor.hide_message_in_png(str(cover), "Hello ü", "key", str(out))
+
+    payload = "Hello ükey".encode("utf-8")
+    expected = _legacy_embed(cover, _bit_string(_header(len(payload)) + payload))
+    assert np.array_equal(np.array(Image.open(out)), expected)
+
+
+def test_hide_file_matches_bitwise_reference(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", mode="RGBA")
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(bytes(range(40)))
+    out = tmp_path / "out.png"
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out))
+
+    payload = secret.read_bytes()
+    expected = _legacy_embed(cover, _bit_string(_header(len(payload)) + payload))
+    assert np.array_equal(np.array(Image.open(out)), expected)
+
+
+def test_decode_message_roundtrip(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png")
+    out = tmp_path / "out.png"
+    assert image_encryptor.hide_message_in_png(str(cover), "Secret message", "k3y", str(out))
+    assert image_encryptor.decode_message_from_png(str(out), "k3y") == "Secret message"
+    assert image_encryptor.decode_message_from_png(str(out), "missing") == "Couldn't find the message."
+
+
+def test_decode_file_writes_only_payload(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(64, 64))
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(b"\x00\xffA" * 100)
+    out = tmp_path / "out.png"
+    decoded = tmp_path / "decoded.bin"
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out))
+    assert image_encryptor.decode_file_from_png(str(out), str(decoded))
+    assert decoded.read_bytes() == secret.read_bytes()
+
+
+def test_legacy_images_still_decode(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(9, 3))
+    legacy = tmp_path / "legacy.png"
+    Image.fromarray(_legacy_embed(cover, _bit_string(b"hi!key"))).save(legacy)
+    assert image_encryptor.decode_message_from_png(str(legacy), "key") == "hi!"
+
+    decoded = tmp_path / "decoded.bin"
+    assert image_encryptor.decode_file_from_png(str(legacy), str(decoded))
+    bits = ''.join(str(v & 1) for v in np.array(Image.open(legacy)).reshape(-1))
+    expected = bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+    assert decoded.read_bytes() == expected
+
+
+def test_multi_bit_roundtrip_and_capacity(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(20, 20))
+    capacities = image_encryptor.image_capacity(str(cover))
+    assert capacities == {bits: (20 * 20 * 3 - 128) * bits // 8 for bits in range(1, 5)}
+
+    for bits in (2, 3, 4):
+        secret = tmp_path / "secret.bin"
+        secret.write_bytes(bytes(range(200)) * 2)
+        out = tmp_path / f"out{bits}.png"
+        decoded = tmp_path / f"decoded{bits}.bin"
+        ok = image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), bits_per_channel=bits)
+        assert ok == (secret.stat().st_size <= capacities[bits])
+        if ok:
+            assert image_encryptor.decode_file_from_png(str(out), str(decoded))
+            assert decoded.read_bytes() == secret.read_bytes()
+            diff = np.array(Image.open(out)).astype(int) - np.array(Image.open(cover)).astype(int)
+            assert np.abs(diff).max() < 2 ** bits
+
+        out = tmp_path / f"msg{bits}.png"
+        assert image_encryptor.hide_message_in_png(str(cover), "héllo", "k", str(out), bits_per_channel=bits)
+        assert image_encryptor.decode_message_from_png(str(out), "k") == "héllo"
+
+
+def test_sharded_roundtrip_in_any_order(tmp_path: Path):
+    covers = [str(_make_image(tmp_path / f"cover{i}.png", size=(24, 24), seed=i)) for i in range(4)]
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(np.random.default_rng(1).integers(0, 256, 500, dtype=np.uint8).tobytes())
+    out_dir = tmp_path / "shards"
+    out_dir.mkdir()
+
+    shards = image_encryptor.hide_file_in_pngs(covers, str(secret), str(out_dir), workers=2)
+    assert len(shards) == 3
+
+    decoded = tmp_path / "decoded.bin"
+    assert image_encryptor.decode_file_from_pngs(shards[::-1], str(decoded), workers=2)
+    assert decoded.read_bytes() == secret.read_bytes()
+
+    assert image_encryptor.decode_file_from_pngs(shards[:2], str(tmp_path / "partial.bin")) is None
+    assert not (tmp_path / "partial.bin").exists()
+
+
+def test_small_tile_budget_matches_whole_image(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(37, 29))
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(np.random.default_rng(2).integers(0, 256, 300, dtype=np.uint8).tobytes())
+    for bits in (1, 3):
+        whole = tmp_path / f"whole{bits}.png"
+        banded = tmp_path / f"banded{bits}.png"
+        assert image_encryptor.hide_file_in_png(str(cover), str(secret), "k", str(whole), bits)
+        assert image_encryptor.hide_file_in_png(str(cover), str(secret), "k", str(banded), bits, tile_budget=1)
+        assert np.array_equal(np.array(Image.open(whole)), np.array(Image.open(banded)))
+
+        decoded = tmp_path / f"decoded{bits}.bin"
+        assert image_encryptor.decode_file_from_png(str(banded), str(decoded), tile_budget=200)
+        assert decoded.read_bytes() == secret.read_bytes()
+
+
+def test_tile_budget_bounds_working_memory():
+    import tracemalloc
+
+    budget = 1 << 18
+    rng = np.random.default_rng(3)
+    for bits in (1, 4):
+        image = Image.fromarray(rng.integers(0, 256, size=(600, 600, 3), dtype=np.uint8))
+        payload = rng.integers(0, 256, 600 * 600 * 3 * bits // 8 - 64, dtype=np.uint8).tobytes()
+        tracemalloc.start()
+        image_encryptor._embed_image(image, payload, bits, tile_budget=budget)
+        embed_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        encoded = io.BytesIO()
+        image.save(encoded, "PNG")
+        encoded.seek(0)
+        tracemalloc.start()
+        _header, chunks = image_encryptor._stored_chunks(encoded, budget)
+        extracted = bytearray()
+        for chunk in chunks:
+            extracted += chunk
+            del chunk
+        extract_peak = tracemalloc.get_traced_memory()[1] - len(extracted)
+        tracemalloc.stop()
+        assert extracted == payload
+        assert embed_peak < 2 * budget and extract_peak < 2 * budget
+
+
+def test_decoding_stops_after_the_payload_rows():
+    # Uncompressed PNG data cut after its first third: only the top rows can still be decoded, so
+    # this fails as soon as the partial decode in ``_open_rows`` stops taking effect.
+    pixels = np.random.default_rng(4).integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    image_encryptor.hide_bytes_in_image(image, b"top rows only")
+    encoded = io.BytesIO()
+    image.save(encoded, "PNG", compress_level=0)
+    truncated = encoded.getvalue()[:len(encoded.getvalue()) // 3]
+
+    top = image_encryptor._open_rows(io.BytesIO(truncated), 8)
+    assert top.size == (64, 8)
+    assert np.array_equal(np.asarray(top), np.asarray(image)[:8])
+    assert image_encryptor.decode_bytes_from_image(truncated) == b"top rows only"
+    with pytest.raises(OSError):
+        Image.open(io.BytesIO(truncated)).load()
+
+
+def test_covers_without_partial_decoding_are_decoded_once(monkeypatch):
+    from PIL import ImageFile
+
+    pixels = np.random.default_rng(5).integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+    image_encryptor.hide_bytes_in_image(pixels, b"bitmap payload")
+    decodes = []
+    original_load = ImageFile.ImageFile.load
+
+    def counting_load(image):
+        if image.tile:
+            decodes.append(image.format)
+        return original_load(image)
+
+    monkeypatch.setattr(ImageFile.ImageFile, "load", counting_load)
+    for image_format in ("BMP", "TIFF"):
+        encoded = io.BytesIO()
+        Image.fromarray(pixels).save(encoded, image_format)
+        decodes.clear()
+        assert image_encryptor.decode_bytes_from_image(encoded.getvalue()) == b"bitmap payload"
+        assert decodes == [image_format]
+
+
+def test_in_memory_api_matches_path_api(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(40, 30))
+    out = tmp_path / "out.png"
+    payload = bytes(range(256)) * 3
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(payload)
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), 2)
+    expected = np.array(Image.open(out))
+
+    encoded = image_encryptor.hide_bytes_in_image(cover.read_bytes(), memoryview(payload), 2)
+    assert np.array_equal(np.array(Image.open(io.BytesIO(encoded))), expected)
+
+    array = np.array(Image.open(cover))
+    assert image_encryptor.hide_bytes_in_image(array, payload, 2) is array
+    assert np.array_equal(array, expected)
+
+    strided = np.array(Image.open(cover))[:, ::-1]
+    image_encryptor.hide_bytes_in_image(strided, payload[:300])
+    assert image_encryptor.decode_bytes_from_image(strided) == payload[:300]
+
+    for source in (encoded, io.BytesIO(encoded), Image.open(out), expected, str(out)):
+        assert image_encryptor.decode_bytes_from_image(source) == payload
+
+    message_image = image_encryptor.hide_message_in_image(Image.open(cover), "Hello ü", "key")
+    assert image_encryptor.decode_message_from_image(message_image, "key") == "Hello ü"
+    assert image_encryptor.decode_message_from_image(message_image, "other") is None
+
+
+def test_compressed_payloads_decode_transparently(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(40, 30))
+    text = b'{"name": "value", "items": [1, 2, 3]}\n' * 100
+    assert len(text) > image_encryptor.image_capacity(str(cover))[1]
+    secret = tmp_path / "secret.json"
+    secret.write_bytes(text)
+
+    for codec in ("zlib", "bz2", "lzma", "auto"):
+        out = tmp_path / f"{codec}.png"
+        assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), compression=codec)
+        header = image_encryptor._image_header(Image.open(out))
+        assert header.compression.length == len(text)
+        assert image_encryptor.decode_bytes_from_image(str(out)) == text
+
+    noise = np.random.default_rng(1).integers(0, 256, 200, dtype=np.uint8).tobytes()
+    encoded = image_encryptor.hide_bytes_in_image(cover.read_bytes(), noise, compression="auto")
+    assert image_encryptor._image_header(Image.open(io.BytesIO(encoded))).compression is None
+    assert image_encryptor.decode_bytes_from_image(encoded) == noise
+
+    out = tmp_path / "message.png"
+    message = "repeat " * 200
+    assert image_encryptor.hide_message_in_png(str(cover), message, "key", str(out), compression="lzma",
+                                               compression_level=9)
+    assert image_encryptor.decode_message_from_png(str(out), "key") == message
+
+
+def test_auto_compression_falls_back_without_holding_both_copies(tmp_path: Path, monkeypatch):
+    import tracemalloc
+
+    import payload_compression
+
+    # Let the incompressible data past the first-chunk probe, so the running size check has to stop it.
+    monkeypatch.setattr(payload_compression, "_PROBE_RATIO", 2)
+    noise = np.random.default_rng(6).integers(0, 256, 4 << 20, dtype=np.uint8).tobytes()
+    secret = tmp_path / "noise.bin"
+    secret.write_bytes(b"head" + noise)
+    with open(secret, "rb") as file:
+        assert file.read(4) == b"head"
+        tracemalloc.start()
+        data, codec_id, length = payload_compression.compress(file, "auto")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert (codec_id, length) == (None, len(noise)) and data == noise
+    assert peak < 2 * len(noise)
+
+    class Unseekable:
+        def __init__(self):
+            self.file = io.BytesIO(noise)
+
+        def read(self, size=-1):
+            return self.file.read(size)
+
+    assert payload_compression.compress(Unseekable(), "auto") == (noise, None, len(noise))
+
+
+def test_cover_cache_reuses_pixels_without_modifying_them(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(40, 30))
+    expected = []
+    for index in range(3):
+        out = tmp_path / f"plain{index}.png"
+        assert image_encryptor.hide_message_in_png(str(cover), f"message {index}", "key", str(out))
+        expected.append(np.array(Image.open(out)))
+
+    image_encryptor.enable_cover_cache(max_bytes=1 << 20)
+    try:
+        for index in range(3):
+            out = tmp_path / f"cached{index}.png"
+            assert image_encryptor.hide_message_in_png(str(cover), f"message {index}", "key", str(out))
+            assert np.array_equal(np.array(Image.open(out)), expected[index])
+        stats = image_encryptor.cover_cache_stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+
+        _make_image(cover, size=(40, 30), seed=5)
+        assert image_encryptor.hide_message_in_png(str(cover), "changed", "key", str(tmp_path / "changed.png"))
+        assert image_encryptor.cover_cache_stats()["misses"] == 2
+
+        image_encryptor.enable_cover_cache(max_bytes=1000)
+        image_encryptor.hide_bytes_in_image(cover.read_bytes(), b"payload")
+        assert image_encryptor.cover_cache_stats()["entries"] == 0
+    finally:
+        image_encryptor.disable_cover_cache()
+
+
+def test_cover_cache_hits_keep_image_info(tmp_path: Path):
+    from PIL import ImageCms
+
+    cover = tmp_path / "cover.png"
+    icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    Image.open(_make_image(cover, size=(40, 30))).save(cover, icc_profile=icc_profile, transparency=(1, 2, 3))
+    uncached = image_encryptor.hide_bytes_in_image(str(cover), b"payload")
+
+    image_encryptor.enable_cover_cache(max_bytes=1 << 20)
+    try:
+        outputs = [image_encryptor.hide_bytes_in_image(str(cover), b"payload") for _ in range(2)]
+        assert image_encryptor.cover_cache_stats()["hits"] == 1
+    finally:
+        image_encryptor.disable_cover_cache()
+    assert outputs == [uncached, uncached]
+    info = Image.open(io.BytesIO(outputs[1])).info
+    assert info["icc_profile"] == icc_profile and info["transparency"] == (1, 2, 3)
+
+
+def test_scattered_payloads_need_the_key(tmp_path: Path):
+    from scatter import KeyedPermutation
+
+    permutation = KeyedPermutation("key", bytes(16), 1000)
+    assert sorted(permutation.positions(0, 1000)) == list(range(1000))
+
+    cover = _make_image(tmp_path / "cover.png", size=(40, 30))
+    payload = bytes(range(256)) + bytes(44)
+    for bits in (1, 2):
+        array = np.array(Image.open(cover))
+        image_encryptor.hide_bytes_in_image(array, payload, bits, scatter_key="key")
+        header = image_encryptor._image_header(Image.fromarray(array))
+        assert header.flags & image_encryptor.FLAG_SCATTERED and len(header.salt) == 16
+        changed_rows = np.flatnonzero((array != np.array(Image.open(cover))).any(axis=(1, 2)))
+        assert changed_rows[-1] > 25
+        assert image_encryptor.decode_bytes_from_image(array, scatter_key="key") == payload
+        try:
+            image_encryptor.decode_bytes_from_image(array)
+            assert False, "decoding a scattered payload without the key must fail"
+        except ValueError as e:
+            assert "key" in str(e)
+
+    out = tmp_path / "message.png"
+    assert image_encryptor.hide_message_in_png(str(cover), "Hello", "key", str(out), scatter=True)
+    assert image_encryptor.decode_message_from_png(str(out), "key") == "Hello"
+    assert image_encryptor.decode_message_from_png(str(out), "other") == "Couldn't find the message."
+
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(payload)
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), 2, scatter=True)
+    decoded = tmp_path / "decoded.bin"
+    assert image_encryptor.decode_file_from_png(str(out), str(decoded), key="key")
+    assert decoded.read_bytes() == payload
+    assert image_encryptor.decode_file_from_png(str(out), str(decoded)) is None
+
+
+def test_grayscale_16_bit_and_palette_carriers(tmp_path: Path):
+    payload = bytes(range(256)) * 2
+    source = Image.open(_make_image(tmp_path / "source.png", size=(64, 48), mode="RGBA"))
+    for mode in ("L", "LA"):
+        cover = tmp_path / f"{mode}.png"
+        source.convert(mode).save(cover)
+        out = tmp_path / f"{mode}-out.png"
+        assert image_encryptor.hide_message_in_png(str(cover), "Hello", "key", str(out), 2)
+        assert Image.open(out).mode == mode
+        assert image_encryptor.decode_message_from_png(str(out), "key") == "Hello"
+
+    rng = np.random.default_rng(3)
+    wide = tmp_path / "wide.png"
+    Image.fromarray(rng.integers(0, 1 << 16, size=(24, 32), dtype=np.uint16)).save(wide)
+    assert Image.open(wide).mode == "I;16"
+    assert image_encryptor.image_capacity(str(wide)) == {bits: (32 * 24 - 128) * bits // 8 for bits in range(1, 9)}
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(payload)
+    out = tmp_path / "wide-out.png"
+    assert image_encryptor.hide_file_in_png(str(wide), str(secret), "key", str(out), 8)
+    changed = np.array(Image.open(out)).astype(np.int64) - np.array(Image.open(wide))
+    assert Image.open(out).mode == "I;16" and np.abs(changed).max() < 256
+    assert image_encryptor.decode_bytes_from_image(str(out)) == payload
+    assert not image_encryptor.hide_file_in_png(str(_make_image(tmp_path / "rgb.png")), str(secret), "key",
+                                                str(out), 8)
+
+    array = rng.integers(0, 1 << 16, size=(20, 20, 3), dtype=np.uint16)
+    assert image_encryptor.hide_bytes_in_image(array, payload, 6, scatter_key="key") is array
+    assert image_encryptor.decode_bytes_from_image(array, scatter_key="key") == payload
+
+    palette_cover = tmp_path / "palette.png"
+    source.convert("RGB").quantize(64).save(palette_cover, transparency=5)
+    assert image_encryptor.hide_message_in_png(str(palette_cover), "Hello", "key", str(out)) is False
+    assert image_encryptor.hide_message_in_png(str(palette_cover), "Hello", "key", str(out), convert_palette=True)
+    expected = np.array(Image.open(palette_cover).convert("RGBA"))
+    encoded = np.array(Image.open(out))
+    assert encoded.shape == expected.shape and np.abs(encoded.astype(int) - expected).max() <= 1
+    assert image_encryptor.decode_message_from_png(str(out), "key") == "Hello"
+
+    for mode in ("1", "F"):
+        unsupported = tmp_path / f"mode_{mode}.tiff"
+        source.convert(mode).save(unsupported)
+        assert image_encryptor.hide_message_in_png(str(unsupported), "Hello", "key", str(out)) is False
+        assert image_encryptor.hide_file_in_png(str(unsupported), str(unsupported), "key", str(out)) is False
+        assert image_encryptor.image_capacity(str(unsupported)) is None
+        with pytest.raises(ValueError, match=f"mode {mode} is not supported"):
+            image_encryptor.hide_bytes_in_image(source.convert(mode), payload)
+        with pytest.raises(ValueError, match=f"mode {mode} is not supported"):
+            image_encryptor.decode_bytes_from_image(unsupported.read_bytes())
+
+
+def test_verify_and_inspect_read_only_the_payload(tmp_path: Path):
+    cover = _make_image(tmp_path / "cover.png", size=(64, 48))
+    secret = tmp_path / "secret.txt"
+    secret.write_bytes(b"line of text\n" * 300)
+    out = tmp_path / "out.png"
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), 2, compression="zlib",
+                                            checksum=True)
+    assert image_encryptor.verify_png(str(out)) is True
+
+    report = image_encryptor.inspect_image(str(out))
+    assert (report["image_format"], report["mode"], report["channel_bits"]) == ("PNG", "RGB", 8)
+    assert report["capacity"] == image_encryptor.image_capacity(str(cover))
+    payload = report["payload"]
+    assert payload["bits_per_channel"] == 2 and payload["compression"]["uncompressed_bytes"] == 3900
+    assert payload["checksum"].startswith("crc32:") and not payload["scattered"]
+    assert image_encryptor.inspect_image(str(cover))["payload"] is None
+
+    pixels = np.array(Image.open(out))
+    pixels.reshape(-1)[payload["header_bytes"] * 8 + 40] ^= 1
+    assert image_encryptor.verify_image(pixels) is False
+
+    array = np.array(Image.open(cover))
+    image_encryptor.hide_bytes_in_image(array, b"scattered payload", scatter_key="key", checksum=True)
+    assert image_encryptor.verify_image(array, key="key") is True
+
+    assert image_encryptor.hide_file_in_png(str(cover), str(secret), "key", str(out), 4)
+    assert image_encryptor.verify_png(str(out)) is None
+
+
+def test_header_must_fit_even_for_empty_payloads(tmp_path: Path):
+    # 8x6 RGB holds 144 channel values: enough for the 128-bit header, not for one with a checksum.
+    cover = _make_image(tmp_path / "cover.png", size=(8, 6))
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert not image_encryptor.hide_file_in_png(str(cover), str(empty), "key", str(tmp_path / "out.png"),
+                                                checksum=True)
+    assert image_encryptor.hide_file_in_png(str(cover), str(empty), "key", str(tmp_path / "out.png"))
+
+    pixels = np.array(Image.open(cover))
+    flat = pixels.reshape(-1)
+    header = image_encryptor._pack_header(0, image_encryptor.FLAG_CHECKSUM, checksum=0)
+    flat &= 0xFE
+    flat |= np.unpackbits(np.frombuffer(header, dtype=np.uint8))[:flat.size]
+    truncated = tmp_path / "truncated.png"
+    Image.fromarray(pixels).save(truncated)
+    assert image_encryptor.decode_file_from_png(str(truncated), str(tmp_path / "decoded.bin")) is None
+    assert image_encryptor.inspect_image(str(truncated)) is None
+    assert image_encryptor.verify_png(str(truncated)) is None
+
+
+def test_frames_stream_payload_across_apng_and_sequences(tmp_path: Path):
+    from apng_writer import APNGWriter
+
+    rng = np.random.default_rng(4)
+    frames = [rng.integers(0, 256, size=(24, 32, 4), dtype=np.uint8) for _ in range(5)]
+    animation = tmp_path / "animation.png"
+    with open(animation, "wb") as file:
+        writer = APNGWriter(file, len(frames), loop=3)
+        for index, frame in enumerate(frames):
+            writer.add(Image.fromarray(frame), duration=20 * (index + 1))
+        writer.close()
+    with Image.open(animation) as image:
+        assert (image.n_frames, image.info["loop"]) == (5, 3)
+        image.seek(4)
+        assert np.array_equal(np.array(image), frames[4]) and image.info["duration"] == 100
+
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(rng.integers(0, 256, 2500, dtype=np.uint8).tobytes())
+    out = tmp_path / "out.png"
+    decoded = tmp_path / "decoded.bin"
+    assert image_encryptor.hide_file_in_frames(str(animation), str(secret), str(out), 3) == [str(out)]
+    with Image.open(out) as image:
+        assert image.n_frames == 5 and image.info["duration"] == 20
+    assert image_encryptor.inspect_image(str(out))["payload"]["frames"] == 3
+    assert image_encryptor.decode_file_from_frames(str(out), str(decoded))
+    assert decoded.read_bytes() == secret.read_bytes()
+    assert image_encryptor.decode_file_from_png(str(out), str(decoded)) is None
+
+    sequence = []
+    for index, frame in enumerate(frames):
+        sequence.append(str(tmp_path / f"frame_{index:03d}.png"))
+        Image.fromarray(frame[..., :3]).save(sequence[-1])
+    written = image_encryptor.hide_file_in_frames(sequence, str(secret), str(tmp_path / "encoded"), 2)
+    assert [Path(path).name for path in written] == [Path(path).name for path in sequence]
+    assert image_encryptor.decode_file_from_frames(written, str(decoded))
+    assert decoded.read_bytes() == secret.read_bytes()
+    assert image_encryptor.decode_file_from_frames(written[:1], str(decoded)) is None
+    assert image_encryptor.hide_file_in_frames(sequence[:2], str(secret), str(tmp_path / "small"), 1) is False
+
+    (tmp_path / "other").mkdir()
+    clashing = str(tmp_path / "other" / "frame_001.jpg")
+    Image.fromarray(frames[1][..., :3]).save(clashing)
+    assert image_encryptor.hide_file_in_frames([*sequence, clashing], str(secret), str(tmp_path / "clash"), 2) is False
+    assert not (tmp_path / "clash").exists()
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import instrumentation
+import text_encryptor
+
+
+def test_disabled_stage_is_shared_no_op():
+    assert instrumentation.stage("a") is instrumentation.stage("b")
+    with instrumentation.stage("a") as timer:
+        timer.nbytes = 10
+    assert instrumentation.records() == []
+
+
+def test_listener_and_summary_collect_stages(tmp_path: Path):
+    seen = []
+    instrumentation.add_listener(seen.append)
+    instrumentation.enable()
+    try:
+        plain = tmp_path / "plain.txt"
+        plain.write_text("abc" * 10, encoding="utf-8")
+        assert text_encryptor.encrypt_text_file(str(plain), "key", str(tmp_path / "enc.txt"))
+        summary = {entry["stage"]: entry for entry in instrumentation.summary()}
+    finally:
+        instrumentation.disable()
+        instrumentation.remove_listener(seen.append)
+        instrumentation.reset()
+
+    assert summary["transform"]["bytes"] == 30
+    assert summary["read"]["bytes"] == 30
+    assert [record["stage"] for record in seen].count("write") == summary["write"]["calls"]
+
+
+def test_stats_include_stages_run_in_worker_processes(tmp_path: Path, capsys):
+    import json
+
+    import numpy as np
+    from PIL import Image
+
+    import cli
+
+    images = []
+    for index in range(2):
+        images.append(str(tmp_path / f"cover{index}.png"))
+        Image.fromarray(np.full((40, 60, 3), index, dtype=np.uint8)).save(images[-1])
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(bytes(range(256)) * 2)
+    texts = tmp_path / "texts"
+    texts.mkdir()
+    (texts / "a.txt").write_text("Hello World", encoding="utf-8")
+
+    commands = [
+        (["hide-file-sharded", str(secret), str(tmp_path / "shards"), *images, "--workers", "2"], "embed"),
+        (["encrypt-tree", str(texts), "k", str(tmp_path / "encrypted"), "--workers", "2"], "transform"),
+    ]
+    for argv, worker_stage in commands:
+        cli.execute(cli.parse_args([*argv, "--stats-json"]))
+        err = capsys.readouterr().err
+        report = json.loads(err[err.index('{\n  "command"'):])
+        assert worker_stage in {entry["stage"] for entry in report["stages"]}
+    assert instrumentation.records() == []
+
+
+def test_listeners_receive_stages_run_in_worker_processes(tmp_path: Path):
+    import text_tree
+
+    (tmp_path / "texts").mkdir()
+    (tmp_path / "texts" / "a.txt").write_text("Hello World", encoding="utf-8")
+    seen = []
+    instrumentation.add_listener(seen.append)
+    try:
+        text_tree.encrypt_tree(str(tmp_path / "texts"), "k", str(tmp_path / "encrypted"), workers=1)
+    finally:
+        instrumentation.remove_listener(seen.append)
+    assert "transform" in {record["stage"] for record in seen}
+    assert instrumentation.records() == []
+
+
+def test_failed_verify_still_prints_stats(tmp_path: Path, capsys, monkeypatch):
+    import json
+
+    import numpy as np
+    import pytest
+    from PIL import Image
+
+    import cli
+
+    cover = tmp_path / "cover.png"
+    Image.fromarray(np.zeros((20, 30, 3), dtype=np.uint8)).save(cover)
+    assert cli.execute(cli.parse_args(["verify", str(cover), "--stats-json"])) == 1
+    captured = capsys.readouterr()
+    assert "Payload intact" not in captured.out
+    assert json.loads(captured.err)["command"] == "verify"
+
+    monkeypatch.setattr(sys, "argv", ["cli.py", "verify", str(cover), "--stats"])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main()
+    assert exit_info.value.code == 1
+    assert "total wall time" in capsys.readouterr().err
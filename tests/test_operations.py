@@ -0,0 +1,31 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import cli
+import operations
+
+
+def test_every_operation_resolves():
+    for name in operations.OPERATIONS:
+        assert callable(operations.load(name))
+
+
+def test_default_tile_budget_matches_codec():
+    import image_encryptor
+
+    assert cli.DEFAULT_TILE_BUDGET_MIB << 20 == image_encryptor.TILE_BUDGET
+
+
+def test_text_commands_do_not_import_image_codec():
+    script = (
+        "import sys, cli, menus\n"
+        "cli.execute(cli.parse_args(['encrypt-text', 'Hello World', 'Key']))\n"
+        "assert not {'numpy', 'PIL', 'image_encryptor'} & set(sys.modules), sorted(sys.modules)\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout == "Rijvs Gspvh\n"
@@ -24,3 +24,80 @@ def test_encrypt_decrypt_file_roundtrip(tmp_path: Path):
     assert text_encryptor.encrypt_text_file(str(plain), "key", str(enc))
     assert text_encryptor.decrypt_text_file(str(enc), "key", str(dec))
     assert dec.read_text(encoding="utf-8") == "Sample Text"
+
+
+def test_failed_file_encryption_leaves_no_partial_output(tmp_path: Path):
+    import pytest
+
+    broken = tmp_path / "broken.txt"
+    broken.write_bytes(b"Hello World\n" * text_encryptor.CHUNK_SIZE + b"\xff\xfe")
+    enc = tmp_path / "enc.txt"
+
+    with pytest.raises(UnicodeDecodeError):
+        text_encryptor.encrypt_text_file(str(broken), "key", str(enc))
+    assert list(tmp_path.iterdir()) == [broken]
+
+    enc.write_text("previous", encoding="utf-8")
+    with pytest.raises(UnicodeDecodeError):
+        text_encryptor.decrypt_text_file(str(broken), "key", str(enc))
+    assert enc.read_text(encoding="utf-8") == "previous"
+    assert sorted(tmp_path.iterdir()) == [broken, enc]
+
+
+def test_stream_matches_whole_text_across_chunk_boundaries():
+    import io
+
+    message = "The quick, brown fox -- jumps over 13 lazy dogs!\n" * 7
+    key = "Lemon"
+    destination = io.StringIO()
+    count = text_encryptor.encrypt_stream(io.StringIO(message), destination, key, chunk_size=5)
+    assert count == len(message)
+    assert destination.getvalue() == text_encryptor.encrypt_text(message, key)
+
+    restored = io.StringIO()
+    text_encryptor.decrypt_stream(io.StringIO(destination.getvalue()), restored, key, chunk_size=3)
+    assert restored.getvalue() == message
+
+
+def test_batch_matches_single_calls():
+    messages = ["Hello World!", "", "ÉéßΩ naïve café 42", "x"]
+    encrypted = text_encryptor.encrypt_texts(messages, "Secret")
+    assert encrypted == [text_encryptor.encrypt_text(m, "Secret") for m in messages]
+    assert text_encryptor.decrypt_texts(encrypted, "Secret") == [
+        text_encryptor.decrypt_text(c, "Secret") for c in encrypted
+    ]
+
+
+def test_bytes_api_matches_text_api():
+    import io
+
+    text = "Hello — World! 42"
+    encrypted = text_encryptor.encrypt_bytes(memoryview(text.encode("utf-8")), "key")
+    assert encrypted == text_encryptor.encrypt_text(text, "key").encode("utf-8")
+    assert text_encryptor.decrypt_bytes(io.BytesIO(encrypted), "key") == text.encode("utf-8")
+
+
+def test_kernel_matches_per_character_reference_in_bounded_memory():
+    import tracemalloc
+
+    key = "Lemon"
+    shifts = [ord(char) - ord('a') for char in key.lower()]
+    for text in ("Plain ASCII, 42!", "Grüße, café", "Ωmega naïve", "Emoji 😀 and \udcff escapes"):
+        text *= 7
+        expected = "".join(text_encryptor._shift_char(char, shifts[index % len(key)]) if char.isalpha() else char
+                           for index, char in enumerate(text))
+        assert text_encryptor.encrypt_text(text, key) == expected
+
+    text = "The quick, brown fox -- jumps over 13 lazy dogs!\n" * 20000
+    tracemalloc.start()
+    text_encryptor.encrypt_text(text, key)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 3 * len(text)
+
+
+def test_shift_tables_cache_a_bounded_number_of_code_points():
+    table = text_encryptor._ShiftTable(3)
+    text = "".join(chr(codepoint) for codepoint in range(0x4E00, 0x4E00 + 2 * text_encryptor.MAX_CACHED_CODEPOINTS))
+    assert text.translate(table) == "".join(text_encryptor._shift_char(char, 3) for char in text)
+    assert len(table) == 128 + text_encryptor.MAX_CACHED_CODEPOINTS
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import text_encryptor
+import text_tree
+
+
+def test_tree_runs_only_process_changed_files(tmp_path: Path):
+    source = tmp_path / "exports"
+    (source / "daily" / "2024").mkdir(parents=True)
+    texts = {f"daily/2024/{index}.txt": f"Export number {index}\nHello World\n" * (index + 1) for index in range(5)}
+    texts["summary.csv"] = "name,value\nalpha,1\n"
+    for name, text in texts.items():
+        (source / name).write_text(text, encoding="utf-8")
+    (source / "broken.txt").write_bytes(b"\xff\xfe not utf-8")
+    encrypted = tmp_path / "encrypted"
+
+    seen = []
+    summary = text_tree.encrypt_tree(str(source), "Key", str(encrypted), workers=2, on_result=seen.append)
+    assert (summary["files"], summary["processed"], summary["unchanged"], summary["failed"]) == (7, 6, 0, 1)
+    assert summary["errors"][0]["path"] == "broken.txt" and len(seen) == 7
+    assert summary["bytes"] == sum(len(text.encode("utf-8")) for text in texts.values())
+    assert summary["files_per_second"] > 0 and summary["bytes_per_second"] > 0
+    for name, text in texts.items():
+        assert (encrypted / name).read_text(encoding="utf-8") == text_encryptor.encrypt_text(text, "Key")
+    assert not list(encrypted.rglob("*.part"))
+    json.dumps(summary)
+
+    decrypted = tmp_path / "decrypted"
+    summary = text_tree.decrypt_tree(str(encrypted), "Key", str(decrypted))
+    assert summary["processed"] == 6
+    assert all((decrypted / name).read_text(encoding="utf-8") == text for name, text in texts.items())
+
+    (source / "broken.txt").unlink()
+    summary = text_tree.encrypt_tree(str(source), "Key", str(encrypted))
+    assert (summary["processed"], summary["unchanged"]) == (0, 6)
+
+    (source / "summary.csv").write_text("name,value\nalpha,20\n", encoding="utf-8")
+    touched = source / "daily" / "2024" / "3.txt"
+    os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+    (encrypted / "daily" / "2024" / "0.txt").unlink()
+    summary = text_tree.encrypt_tree(str(source), "Key", str(encrypted))
+    assert (summary["processed"], summary["unchanged"]) == (2, 4)
+    assert (encrypted / "summary.csv").read_text(encoding="utf-8") == text_encryptor.encrypt_text(
+        "name,value\nalpha,20\n", "Key")
+
+    summary = text_tree.encrypt_tree(str(source), "Other", str(encrypted))
+    assert summary["processed"] == 6
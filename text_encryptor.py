@@ -1,6 +1,14 @@
 """Utilities for encrypting and decrypting text using a repeating key."""
 
+import os
+from functools import lru_cache
+
+from instrumentation import stage
+
 ALPHABET_SIZE = 26
+CHUNK_SIZE = 1 << 16
+# Non-ASCII code points each shift table remembers; any others are resolved again every time.
+MAX_CACHED_CODEPOINTS = 4096
 
 
 def _shift_char(char: str, shift: int) -> str:
@@ -10,20 +18,197 @@ def _shift_char(char: str, shift: int) -> str:
     return chr((ord(char) - base + shift) % ALPHABET_SIZE + base)
 
 
+class _ShiftTable(dict):
+    """``str.translate`` table shifting letters by ``shift`` places.
+
+    ASCII is filled in up front; any other character is resolved with the same rules as
+    ``_shift_char`` the first time it is seen and cached, up to ``MAX_CACHED_CODEPOINTS`` of them.
+    """
+
+    def __init__(self, shift: int) -> None:
+        super().__init__()
+        self.shift = shift
+        for codepoint in range(128):
+            self[codepoint] = self._resolve(chr(codepoint))
+
+    def _resolve(self, char: str) -> str:
+        return _shift_char(char, self.shift) if char.isalpha() else char
+
+    def __missing__(self, codepoint: int) -> str:
+        result = self._resolve(chr(codepoint))
+        if len(self) < 128 + MAX_CACHED_CODEPOINTS:
+            self[codepoint] = result
+        return result
+
+
+@lru_cache(maxsize=ALPHABET_SIZE)
+def _shift_table(shift: int) -> _ShiftTable:
+    """Return the shared translation table for ``shift`` (taken modulo the alphabet size)."""
+
+    return _ShiftTable(shift)
+
+
+@lru_cache(maxsize=128)
+def _key_schedule(key: str, sign: int) -> tuple:
+    """Return one translation table per key position for encrypting (``sign=1``) or decrypting (``-1``)."""
+
+    return tuple(_shift_table(sign * (ord(key_char.lower()) - ord('a')) % ALPHABET_SIZE) for key_char in key)
+
+
+def _code_units(text: str) -> tuple:
+    """Return ``(width, encoding)`` of the narrowest fixed-width encoding holding ``text`` and its translation.
+
+    Shifted letters are ASCII and other characters are left alone, so the translation never needs a
+    wider code unit than ``text``. UTF-16 is only used below the surrogate range, where every code
+    unit decodes back to the same character on its own.
+    """
+
+    if text.isascii():
+        return 1, "ascii"
+    highest = ord(max(text))
+    if highest < 0x100:
+        return 1, "latin-1"
+    if highest < 0xD800:
+        return 2, "utf-16-le"
+    return 4, "utf-32-le"
+
+
+def _apply(text: str, schedule: tuple, offset: int = 0) -> str:
+    """Return ``text`` translated with ``schedule``, the first character using key position ``offset``.
+
+    The key advances on every character, letters or not, so each key position owns the strided
+    slice ``text[p::len(key)]`` and can be translated in one ``str.translate`` call. The translated
+    slices are interleaved into one buffer of fixed-width code units (see ``_code_units``) that is
+    decoded once at the end.
+    """
+
+    key_length = len(schedule)
+    if not key_length:
+        if any(char.isalpha() for char in text):
+            raise ValueError("The key must not be empty.")
+        return text
+    if key_length == 1:
+        return text.translate(schedule[0])
+
+    width, encoding = _code_units(text)
+    buffer = bytearray(len(text) * width)
+    stride = key_length * width
+    for position in range(min(key_length, len(text))):
+        table = schedule[(offset + position) % key_length]
+        encoded = text[position::key_length].translate(table).encode(encoding, "surrogatepass")
+        for unit in range(width):
+            buffer[position * width + unit::stride] = encoded[unit::width]
+    return buffer.decode(encoding, "surrogatepass")
+
+
+def _transform(text: str, key: str, sign: int, offset: int = 0) -> str:
+    """Return ``text`` with every letter shifted by ``sign`` times its key shift.
+
+    ``offset`` is the position of ``text`` within the whole input, so the key phase stays correct
+    when a long input is processed in several pieces.
+    """
+
+    with stage("transform", len(text)):
+        return _apply(text, _key_schedule(key, sign), offset)
+
+
+def _transform_stream(source, destination, key: str, sign: int, chunk_size: int) -> int:
+    """Copy ``source`` to ``destination`` in ``chunk_size`` pieces, shifting letters on the way.
+
+    Returns the number of characters processed.
+    """
+
+    schedule = _key_schedule(key, sign)
+    offset = 0
+    while True:
+        with stage("read") as timer:
+            chunk = source.read(chunk_size)
+            timer.nbytes = len(chunk)
+        if not chunk:
+            return offset
+        with stage("transform", len(chunk)):
+            result = _apply(chunk, schedule, offset)
+        with stage("write", len(result)):
+            destination.write(result)
+        offset += len(chunk)
+
+
 def encrypt_text(plaintext: str, key: str) -> str:
     """Encrypt ``plaintext`` using ``key`` and return the resulting text."""
 
-    encrypted_text = ""
-    key_length = len(key)
-    for i, char in enumerate(plaintext):
-        if char.isalpha():
-            key_char = key[i % key_length]
-            key_shift = ord(key_char.lower()) - ord('a')
-            encrypted_char = _shift_char(char, key_shift)
-            encrypted_text += encrypted_char
-        else:
-            encrypted_text += char
-    return encrypted_text
+    return _transform(plaintext, key, 1)
+
+
+def encrypt_texts(plaintexts, key: str) -> list:
+    """Encrypt every string in ``plaintexts`` with ``key``, building the key schedule only once."""
+
+    schedule = _key_schedule(key, 1)
+    with stage("transform"):
+        return [_apply(plaintext, schedule) for plaintext in plaintexts]
+
+
+def decrypt_texts(ciphertexts, key: str) -> list:
+    """Decrypt every string in ``ciphertexts`` with ``key``, building the key schedule only once."""
+
+    schedule = _key_schedule(key, -1)
+    with stage("transform"):
+        return [_apply(ciphertext, schedule) for ciphertext in ciphertexts]
+
+
+def encrypt_stream(source, destination, key: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """Encrypt the text file object ``source`` into ``destination`` using constant memory.
+
+    Returns the number of characters processed.
+    """
+
+    return _transform_stream(source, destination, key, 1, chunk_size)
+
+
+def decrypt_stream(source, destination, key: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """Decrypt the text file object ``source`` into ``destination`` using constant memory.
+
+    Returns the number of characters processed.
+    """
+
+    return _transform_stream(source, destination, key, -1, chunk_size)
+
+def _transform_bytes(data, key: str, sign: int, encoding: str) -> bytes:
+    """Return the bytes-like or binary file object ``data`` decoded, shifted and encoded again."""
+
+    if hasattr(data, "read"):
+        with stage("read") as timer:
+            data = data.read()
+            timer.nbytes = len(data)
+    text = str(memoryview(data), encoding)
+    return _transform(text, key, sign).encode(encoding)
+
+
+def encrypt_bytes(data, key: str, encoding: str = "utf-8") -> bytes:
+    """Encrypt the encoded text ``data`` (bytes-like or a binary file object) and return it encoded the same way."""
+
+    return _transform_bytes(data, key, 1, encoding)
+
+
+def decrypt_bytes(data, key: str, encoding: str = "utf-8") -> bytes:
+    """Decrypt the encoded text ``data`` (bytes-like or a binary file object) and return it encoded the same way."""
+
+    return _transform_bytes(data, key, -1, encoding)
+
+def _stream_to_file(transform, source, output_file: str, key: str) -> None:
+    """Run ``transform(source, destination, key)`` into a temporary file renamed to ``output_file`` on success.
+
+    A failure partway through the input, such as a ``UnicodeDecodeError``, leaves no partial output behind.
+    """
+
+    partial = f"{output_file}.{os.getpid()}.part"
+    try:
+        with open(partial, "w", encoding="utf-8") as destination:
+            transform(source, destination, key)
+        os.replace(partial, output_file)
+    except BaseException:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
 
 def encrypt_text_file(file_name: str, key: str, output_file: str) -> bool:
     """Encrypt ``file_name`` using ``key`` and save the result to ``output_file``.
@@ -32,43 +217,29 @@ def encrypt_text_file(file_name: str, key: str, output_file: str) -> bool:
     """
 
     try:
-        with open(file_name, "r", encoding="utf-8") as file:
-            plaintext = file.read()
+        source = open(file_name, "r", encoding="utf-8")
     except FileNotFoundError:
         print("File not found.")
         return False
 
-    encrypted_text = encrypt_text(plaintext, key)
-    with open(output_file, "w", encoding="utf-8") as file:
-        file.write(encrypted_text)
+    with source:
+        _stream_to_file(encrypt_stream, source, output_file, key)
     return True
 
 def decrypt_text_file(file_name: str, key: str, output_file: str) -> bool:
     """Decrypt ``file_name`` using ``key`` and save the result to ``output_file``."""
 
     try:
-        with open(file_name, "r", encoding="utf-8") as file:
-            ciphertext = file.read()
+        source = open(file_name, "r", encoding="utf-8")
     except FileNotFoundError:
         print("File not found.")
         return False
 
-    decrypted_text = decrypt_text(ciphertext, key)
-    with open(output_file, "w", encoding="utf-8") as file:
-        file.write(decrypted_text)
+    with source:
+        _stream_to_file(decrypt_stream, source, output_file, key)
     return True
 
 def decrypt_text(ciphertext: str, key: str) -> str:
     """Return ``ciphertext`` decrypted with ``key``."""
 
-    decrypted_text = ""
-    key_length = len(key)
-    for i, char in enumerate(ciphertext):
-        if char.isalpha():
-            key_char = key[i % key_length]
-            key_shift = ord(key_char.lower()) - ord('a')
-            decrypted_char = _shift_char(char, -key_shift)
-            decrypted_text += decrypted_char
-        else:
-            decrypted_text += char
-    return decrypted_text
+    return _transform(ciphertext, key, -1)
@@ -0,0 +1,240 @@
+"""Incremental encryption and decryption of whole directory trees of text files.
+
+Every file under the source directory is written, encrypted or decrypted, to the same relative path
+under the output directory by a pool of worker processes. A manifest in the output directory records
+the size, modification time and BLAKE2 hash of each source file, so the next run only processes the
+files that changed: files whose size and modification time are unchanged are skipped without being
+read, and files that were only touched are hashed and skipped when their content is the same. Outputs
+and the manifest are written to a temporary file and renamed into place, so an interrupted run never
+leaves a truncated file behind.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+import text_encryptor
+
+MANIFEST_NAME = ".simple-encryptor-manifest.json"
+MANIFEST_VERSION = 1
+
+# Files are handed to the workers in groups of at most this many files or bytes, so trees of many
+# small files do not pay a process round trip per file.
+GROUP_FILES = 64
+GROUP_BYTES = 8 << 20
+
+_READ_SIZE = 1 << 20
+
+_STREAMS = {"encrypt": text_encryptor.encrypt_stream, "decrypt": text_encryptor.decrypt_stream}
+
+
+class _HashingReader(io.RawIOBase):
+    """Raw binary reader that feeds everything read from ``file`` into ``digest``."""
+
+    def __init__(self, file, digest):
+        super().__init__()
+        self._file = file
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self._file.readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        return count
+
+
+def _new_digest():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _file_hash(path):
+    """Return the hex BLAKE2 digest of the file at ``path``."""
+    digest = _new_digest()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _key_fingerprint(action, key):
+    """Return a fingerprint of ``action`` and ``key``; a manifest written with another one is not reused."""
+    return hashlib.blake2b(f"{action}\0{key}".encode("utf-8"), digest_size=8, person=b"encrypt-tree").hexdigest()
+
+
+def _write_atomically(path, write):
+    """Call ``write(file)`` on a temporary text file next to ``path`` and rename it to ``path``."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = f"{path}.{os.getpid()}.part"
+    try:
+        with open(partial, "w", encoding="utf-8") as file:
+            write(file)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.unlink(partial)
+        raise
+
+
+def _process_file(action, key, source, output, previous_hash):
+    """Encrypt or decrypt ``source`` into ``output`` and return ``(status, content_hash)``.
+
+    When ``previous_hash`` is given the file is hashed first and left alone (``"unchanged"``) if its
+    content still has that hash; otherwise it is hashed while it is processed.
+    """
+    if previous_hash is not None:
+        content_hash = _file_hash(source)
+        if content_hash == previous_hash:
+            return "unchanged", content_hash
+    digest = _new_digest()
+    with open(source, "rb") as file:
+        reader = io.TextIOWrapper(io.BufferedReader(_HashingReader(file, digest)), encoding="utf-8")
+        _write_atomically(output, lambda destination: _STREAMS[action](reader, destination, key))
+    return "ok", digest.hexdigest()
+
+
+def _process_group(action, key, tasks):
+    """Process the ``(relative_path, source, output, size, previous_hash)`` ``tasks``; runs in a worker process.
+
+    Returns one result record per task; a failing file is reported without stopping the others.
+    """
+    results = []
+    for relative_path, source, output, size, previous_hash in tasks:
+        started = time.perf_counter()
+        try:
+            status, content_hash = _process_file(action, key, source, output, previous_hash)
+            error = None
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            status, content_hash, error = "error", None, f"{type(e).__name__}: {e}"
+        results.append({
+            "path": relative_path,
+            "status": status,
+            "bytes": size if status == "ok" else 0,
+            "hash": content_hash,
+            "seconds": round(time.perf_counter() - started, 6),
+            "error": error,
+        })
+    return results
+
+
+def _walk(directory, excluded):
+    """Yield ``os.DirEntry`` objects for the regular files under ``directory``, skipping the ``excluded`` real paths."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if os.path.realpath(entry.path) not in excluded:
+                    yield from _walk(entry.path, excluded)
+            elif entry.is_file() and entry.name != MANIFEST_NAME:
+                yield entry
+
+
+def load_tree_manifest(manifest_path):
+    """Return the manifest stored at ``manifest_path``, or an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "key": None, "files": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "key": None, "files": {}}
+    return manifest
+
+
+def _groups(tasks):
+    """Split ``tasks`` into groups of at most ``GROUP_FILES`` files or about ``GROUP_BYTES`` bytes."""
+    group, group_bytes = [], 0
+    for task in tasks:
+        group.append(task)
+        group_bytes += task[3]
+        if len(group) >= GROUP_FILES or group_bytes >= GROUP_BYTES:
+            yield group
+            group, group_bytes = [], 0
+    if group:
+        yield group
+
+
+def process_tree(action, source_dir, key, output_dir, workers=None, manifest_path=None, on_result=None):
+    """Encrypt (``action="encrypt"``) or decrypt (``"decrypt"``) every file under ``source_dir`` into ``output_dir``.
+
+    Only files that changed since the run that wrote the manifest (default: ``MANIFEST_NAME`` in
+    ``output_dir``) are processed, on a pool of ``workers`` processes. ``on_result`` is called with the
+    record of every file that was read. Returns a summary dict with the counts of processed, unchanged
+    and failed files, the wall time, ``files_per_second`` over every file examined and
+    ``bytes_per_second`` over the bytes processed, and the records of the failed files.
+    Raises ``ValueError`` for an unknown action or if ``output_dir`` is ``source_dir``, and ``OSError``
+    if ``source_dir`` cannot be read.
+    """
+    if action not in _STREAMS:
+        raise ValueError(f"Unknown tree action {action!r}")
+    if os.path.realpath(source_dir) == os.path.realpath(output_dir):
+        raise ValueError("The output directory must differ from the source directory")
+    started = time.perf_counter()
+    manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_tree_manifest(manifest_path)
+    fingerprint = _key_fingerprint(action, key)
+    previous = manifest["files"] if manifest["key"] == fingerprint else {}
+
+    files, tasks = {}, []
+    for entry in _walk(source_dir, {os.path.realpath(output_dir)}):
+        relative_path = os.path.relpath(entry.path, source_dir).replace(os.sep, "/")
+        status = entry.stat()
+        output = os.path.join(output_dir, relative_path)
+        record = previous.get(relative_path)
+        files[relative_path] = {"size": status.st_size, "mtime_ns": status.st_mtime_ns,
+                                "hash": record and record["hash"]}
+        if record is not None and os.path.exists(output):
+            if (record["size"], record["mtime_ns"]) == (status.st_size, status.st_mtime_ns):
+                continue
+            previous_hash = record["hash"] if record["size"] == status.st_size else None
+        else:
+            previous_hash = None
+        tasks.append((relative_path, entry.path, output, status.st_size, previous_hash))
+
+    processed = processed_bytes = 0
+    errors = []
+    if tasks:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [instrumentation.submit(pool, _process_group, action, key, group) for group in _groups(tasks)]
+            for future in as_completed(futures):
+                for result in instrumentation.result(future):
+                    if result["status"] == "error":
+                        errors.append(result)
+                        del files[result["path"]]
+                    else:
+                        files[result["path"]]["hash"] = result["hash"]
+                        processed += result["status"] == "ok"
+                        processed_bytes += result["bytes"]
+                    if on_result is not None:
+                        on_result(result)
+
+    manifest = {"version": MANIFEST_VERSION, "key": fingerprint, "files": files}
+    _write_atomically(manifest_path, lambda file: json.dump(manifest, file, indent=1, sort_keys=True))
+    wall = time.perf_counter() - started
+    return {
+        "action": action,
+        "files": len(files) + len(errors),
+        "processed": processed,
+        "unchanged": len(files) - processed,
+        "failed": len(errors),
+        "bytes": processed_bytes,
+        "wall_seconds": round(wall, 6),
+        "files_per_second": round((len(files) + len(errors)) / wall, 1) if wall else 0.0,
+        "bytes_per_second": round(processed_bytes / wall) if wall else 0,
+        "errors": errors,
+    }
+
+
+def encrypt_tree(source_dir, key, output_dir, workers=None, manifest_path=None, on_result=None):
+    """Encrypt the files under ``source_dir`` that changed since the last run into ``output_dir``; see ``process_tree``."""
+    return process_tree("encrypt", source_dir, key, output_dir, workers, manifest_path, on_result)
+
+
+def decrypt_tree(source_dir, key, output_dir, workers=None, manifest_path=None, on_result=None):
+    """Decrypt the files under ``source_dir`` that changed since the last run into ``output_dir``; see ``process_tree``."""
+    return process_tree("decrypt", source_dir, key, output_dir, workers, manifest_path, on_result)